@@ -0,0 +1,60 @@
+"""
+Runs the benchmark suites, optionally saving the results as a baseline
+and comparing them with an earlier one. From the project root:
+
+    python -m benchmarks --save baseline.json
+    python -m benchmarks --compare baseline.json --threshold 0.1
+
+Exits with status 1 when a case regressed by more than the threshold.
+"""
+import argparse
+import sys
+
+from benchmarks import endpoints, logging_pipeline
+from benchmarks.runner import (
+    DATABASES, compare_results, load_results, print_comparison, print_results, save_results
+)
+
+SUITES = ('handlers', 'templates', 'endpoints')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Logging and API benchmarks')
+    parser.add_argument('--suite', choices=SUITES, action='append', help='suite to run, all by default')
+    parser.add_argument('--records', type=int, default=logging_pipeline.RECORDS, help='records per handler/template')
+    parser.add_argument('--requests', type=int, default=endpoints.REQUESTS, help='requests per endpoint')
+    parser.add_argument('--database', choices=DATABASES, default='mongomock', help='database of the endpoints suite')
+    parser.add_argument('--save', metavar='PATH', help='write the results to a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare the results with a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change counted as a regression')
+    arguments = parser.parse_args()
+
+    suites = arguments.suite or SUITES
+    results = []
+
+    if 'handlers' in suites:
+        results += logging_pipeline.run_handlers(arguments.records)
+    if 'templates' in suites:
+        results += logging_pipeline.run_templates(arguments.records)
+    if 'endpoints' in suites:
+        results += endpoints.run(arguments.requests, arguments.database)
+
+    print_results(results)
+
+    if arguments.save:
+        save_results(arguments.save, results)
+
+    if arguments.compare:
+        comparison = compare_results(load_results(arguments.compare), results, arguments.threshold)
+
+        print()
+        print_comparison(comparison)
+
+        if any(row['regressed'] for row in comparison):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+End-to-end latency of every endpoint through the Flask test client, including
+the logging each request does.
+
+    python -m benchmarks.endpoints
+"""
+from benchmarks.runner import benchmark_app, measure, print_results
+from src.user.models import User
+
+REQUESTS = 200
+
+
+def run(requests: int = REQUESTS, database: str = 'mongomock') -> list[dict]:
+    with benchmark_app(database) as app:
+        client = app.test_client()
+        credentials = {'email': 'bench@example.com', 'password': 'password123'}
+
+        client.post('/register', json={**credentials, 'first_name': 'Bench', 'last_name': 'User'})
+
+        if database == 'mongomock':
+            # users and posts share the base_model collection, and its unique email index
+            # rejects every post after the first one as a user without an email
+            User._get_collection().drop_index('email_1')
+        headers = {'Authorization': f'Bearer {client.get('/login', json=credentials).json['access_token']}'}
+
+        def create_post(_=None) -> str:
+            response = client.post('/posts', json={'title': 'Title', 'text': 'Text'}, headers=headers)
+
+            return response.json['post']['id']
+
+        post_id = create_post()
+
+        results = [
+            measure('endpoint.register', lambda index: client.post('/register', json={
+                'email': f'bench{index}@example.com', 'password': 'password123'
+            }), requests),
+            measure('endpoint.login', lambda _: client.get('/login', json=credentials), requests),
+            measure('endpoint.create_post', create_post, requests),
+            measure('endpoint.get_posts', lambda _: client.get('/posts'), requests),
+            measure('endpoint.get_post', lambda _: client.get(f'/posts/{post_id}'), requests),
+            measure('endpoint.update_post', lambda index: client.patch(
+                f'/posts/{post_id}', json={'title': f'Title {index}'}, headers=headers
+            ), requests),
+        ]
+
+        post_ids = [create_post() for _ in range(requests)]
+        results += [
+            measure('endpoint.delete_post', lambda index: client.delete(
+                f'/posts/{post_ids[index]}', headers=headers
+            ), requests),
+            measure('endpoint.get_logs', lambda _: client.get('/'), requests),
+            measure('endpoint.search_logs', lambda _: client.get('/?search=bench'), requests),
+            measure('endpoint.logs_analytics', lambda _: client.get('/logs/analytics?group_by=endpoint'), requests),
+        ]
+
+    return results
+
+
+if __name__ == '__main__':
+    print_results(run())
@@ -0,0 +1,78 @@
+"""
+Microbenchmark of LoggerMessageTemplates.get_changed_record_log at each logger level.
+
+Compares the lazy LogMessage path against eagerly rendering the message before
+calling the logger, as the views did before. Run from the project root:
+
+    python -m benchmarks.lazy_messages
+"""
+import logging
+import os
+import timeit
+
+from bson import ObjectId
+
+from src import app
+from src.logger.logger import LoggerMessageTemplates, LogMessageFilter
+from src.posts.models import Posts
+from src.user.models import User
+
+CALLS = 20000
+LEVELS = ('DEBUG', 'INFO', 'ERROR')
+
+
+def make_logger(level: str) -> logging.Logger:
+    logger = logging.getLogger(f'benchmarks.lazy_messages.{level}')
+    logger.handlers.clear()
+    logger.filters.clear()
+    logger.propagate = False
+    logger.setLevel(level)
+
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s]: %(message)s'))
+    logger.addHandler(handler)
+    logger.addFilter(LogMessageFilter(logger))
+
+    return logger
+
+
+def run() -> list[dict]:
+    user = User(id=ObjectId(), email='bench@example.com', first_name='Bench', last_name='User')
+    post = Posts(id=ObjectId(), title='Title', text='Text', author=user)
+    old_version = {'title': 'Title', 'text': 'Text'}
+    changes = {'title': 'New title', 'text': 'New text'}
+
+    results = []
+
+    with app.test_request_context(f'/posts/{post.id}', method='PATCH'):
+        from flask import request
+
+        for level in LEVELS:
+            logger = make_logger(level)
+
+            def get_message():
+                return LoggerMessageTemplates.get_changed_record_log(user, post, old_version, changes, request)
+
+            def eager():
+                logger.info(str(get_message()))
+
+            def lazy():
+                logger.info(get_message())
+
+            eager_time = min(timeit.repeat(eager, number=CALLS, repeat=3)) / CALLS
+            lazy_time = min(timeit.repeat(lazy, number=CALLS, repeat=3)) / CALLS
+
+            results.append({
+                'level': level,
+                'eager_us': eager_time * 1e6,
+                'lazy_us': lazy_time * 1e6,
+                'speedup': eager_time / lazy_time,
+            })
+
+    return results
+
+
+if __name__ == '__main__':
+    print(f'{"level":<8}{"eager, us":>12}{"lazy, us":>12}{"speedup":>10}')
+    for result in run():
+        print(f'{result["level"]:<8}{result["eager_us"]:>12.2f}{result["lazy_us"]:>12.2f}{result["speedup"]:>9.1f}x')
@@ -0,0 +1,107 @@
+"""
+Benchmarks of the logging hot path: every handler LoggerFactory installs,
+fed with the same records, and every LoggerMessageTemplates method.
+
+    python -m benchmarks.logging_pipeline
+"""
+import logging
+import os
+import tempfile
+
+from bson import ObjectId
+from flask import request
+
+from benchmarks.runner import benchmark_app, measure, print_results
+from src import app
+from src.config import Config
+from src.logger.buffering import BufferedRotatingFileHandler, BufferedStreamHandler
+from src.logger.logger import AsyncDatabaseHandler, DatabaseHandler, LoggerFactory, LoggerMessageTemplates, LogMessage
+from src.logger.rotation import RotatingCompressedFileHandler
+from src.posts.models import Posts
+from src.user.models import User
+
+RECORDS = 5000
+
+
+def make_record(index: int) -> logging.LogRecord:
+    message = LogMessage('endpoint_was_called', {'endpoint': f'/posts/{index}', 'method': 'GET'})
+
+    return logging.LogRecord('benchmarks', logging.INFO, __file__, 0, message, None, None)
+
+
+def run_handlers(records: int = RECORDS) -> list[dict]:
+    buffer_settings = {key: value for key, value in Config.LOGGER_BUFFER_SETTINGS.items() if key != 'enabled'}
+    formatter = logging.Formatter(LoggerFactory.DEFAULT_FORMAT, datefmt=LoggerFactory.DATE_FORMAT)
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+        handlers = {
+            'handler.file': lambda: RotatingCompressedFileHandler(
+                os.path.join(directory, 'file.log'), **Config.LOGGER_FILE_SETTINGS
+            ),
+            'handler.file_buffered': lambda: BufferedRotatingFileHandler(
+                os.path.join(directory, 'buffered.log'), **Config.LOGGER_FILE_SETTINGS, **buffer_settings
+            ),
+            'handler.stream': lambda: logging.StreamHandler(devnull),
+            'handler.stream_buffered': lambda: BufferedStreamHandler(devnull, **buffer_settings),
+            'handler.database': DatabaseHandler,
+            'handler.database_async': lambda: AsyncDatabaseHandler(
+                **{key: value for key, value in Config.LOGGER_DATABASE_SETTINGS.items() if key != 'async'}
+            ),
+        }
+
+        with benchmark_app():
+            for name, create_handler in handlers.items():
+                handler = create_handler()
+                handler.setFormatter(formatter)
+
+                def emit(index: int):
+                    handler.handle(make_record(index))
+
+                try:
+                    results.append(measure(name, emit, records, handler.flush))
+                finally:
+                    handler.close()
+
+    return results
+
+
+def run_templates(records: int = RECORDS) -> list[dict]:
+    """
+    Measures building and rendering each message, which is the work a
+    record costs once a handler accepts it
+    """
+    user = User(id=ObjectId(), email='bench@example.com', first_name='Bench', last_name='User')
+    post = Posts(id=ObjectId(), title='Title', text='Text', author=user)
+    old_version = {'title': 'Title', 'text': 'Text'}
+    new_version = {'title': 'New title', 'text': 'New text'}
+
+    messages = {
+        'template.created_user': lambda: LoggerMessageTemplates.get_created_user_log(user),
+        'template.logged_user': lambda: LoggerMessageTemplates.get_logged_user_log(user),
+        'template.error': lambda: LoggerMessageTemplates.get_error_log('Error', request),
+        'template.error_with_authenticated_user': lambda: (
+            LoggerMessageTemplates.get_error_with_authenticated_user_log(user, request, 'Error')
+        ),
+        'template.the_endpoint_enter': lambda: LoggerMessageTemplates.get_the_endpoint_enter_log(user, request),
+        'template.created_record': lambda: LoggerMessageTemplates.get_created_record_log(user, request, post),
+        'template.changed_record': lambda: (
+            LoggerMessageTemplates.get_changed_record_log(user, post, old_version, new_version, request)
+        ),
+        'template.deleted_record': lambda: LoggerMessageTemplates.get_deleted_record_log(user, request, post),
+        'template.endpoint_was_called': lambda: LoggerMessageTemplates.get_endpoint_was_called_log(request),
+    }
+
+    with app.test_request_context(f'/posts/{post.id}', method='PATCH'):
+        return [
+            measure(name, lambda _, get_message=get_message: str(get_message()), records)
+            for name, get_message in messages.items()
+        ]
+
+
+def run(records: int = RECORDS) -> list[dict]:
+    return run_handlers(records) + run_templates(records)
+
+
+if __name__ == '__main__':
+    print_results(run())
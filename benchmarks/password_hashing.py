@@ -0,0 +1,60 @@
+"""
+Benchmark of password verification throughput, reported as logins/sec and logins/sec per core.
+
+Compares bcrypt running inline on the calling threads with the PasswordHasher
+process pool. Run from the project root:
+
+    python -m benchmarks.password_hashing [rounds]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.user.hashing import PasswordHasher
+
+LOGINS_PER_WORKER = 20
+
+
+def measure(hasher: PasswordHasher, hashed_password: str, logins: int, threads: int) -> float:
+    with ThreadPoolExecutor(threads) as request_threads:
+        started_at = time.perf_counter()
+        assert all(request_threads.map(lambda _: hasher.verify('password123', hashed_password), range(logins)))
+
+        return logins / (time.perf_counter() - started_at)
+
+
+def run(rounds: int = 12) -> list[dict]:
+    cores = os.cpu_count() or 1
+    hashed_password = PasswordHasher({'rounds': rounds, 'workers': 0}).hash('password123')
+    results = []
+
+    for workers in (0, cores):
+        hasher = PasswordHasher({'rounds': rounds, 'workers': workers, 'max_pending': 4 * cores, 'timeout': 600})
+        hasher.verify('password123', hashed_password)  # start the worker processes
+
+        try:
+            logins_per_second = measure(hasher, hashed_password, LOGINS_PER_WORKER * cores, 2 * cores)
+        finally:
+            hasher.shutdown()
+
+        results.append({
+            'mode': 'process pool' if workers else 'inline',
+            'workers': workers,
+            'logins_per_second': logins_per_second,
+            'logins_per_second_per_core': logins_per_second / (workers or cores),
+        })
+
+    return results
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+
+    print(f'bcrypt rounds: {rounds}, cores: {os.cpu_count()}')
+    print(f'{"mode":<14}{"workers":>8}{"logins/s":>12}{"per core":>12}')
+    for result in run(rounds):
+        print(
+            f'{result["mode"]:<14}{result["workers"]:>8}'
+            f'{result["logins_per_second"]:>12.1f}{result["logins_per_second_per_core"]:>12.1f}'
+        )
@@ -0,0 +1,163 @@
+"""
+Measurement, baseline and comparison helpers shared by the benchmark suites.
+
+A suite is a function returning a list of results, one per measured case:
+    {'name': ..., 'operations': ..., 'ops_per_second': ..., 'mean_us': ..., 'p50_us': ..., 'p99_us': ...}
+"""
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+from mongoengine import disconnect
+from flask_mongoengine import MongoEngine
+
+from src import app, logger
+from src.config import Config, TestConfig
+
+DATABASES = ('mongomock', 'config')
+
+
+def measure(
+        name: str,
+        operation: Callable[[int], object],
+        operations: int,
+        finish: Optional[Callable[[], object]] = None
+) -> dict:
+    """
+    Calls operation with the indexes 0..operations-1 and returns the per-call
+    latency percentiles and the throughput. finish runs after the last call
+    and counts in the throughput, for work that is deferred by the operation
+    """
+    latencies = []
+    started_at = time.perf_counter_ns()
+
+    for index in range(operations):
+        call_started_at = time.perf_counter_ns()
+        operation(index)
+        latencies.append(time.perf_counter_ns() - call_started_at)
+
+    if finish:
+        finish()
+
+    elapsed = (time.perf_counter_ns() - started_at) / 1e9
+    latencies.sort()
+
+    return {
+        'name': name,
+        'operations': operations,
+        'ops_per_second': operations / elapsed,
+        'mean_us': statistics.fmean(latencies) / 1e3,
+        'p50_us': latencies[len(latencies) // 2] / 1e3,
+        'p99_us': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] / 1e3,
+    }
+
+
+@contextmanager
+def benchmark_app(database: str = 'mongomock') -> Iterator:
+    """
+    Yields the app connected to an empty mongomock database, or to the
+    database of Config. The console output of the app logger goes to
+    os.devnull meanwhile, so it does not dominate the measurements
+    """
+    if database not in DATABASES:
+        raise ValueError(f"'{database}' is not a valid database, expected one of {DATABASES}")
+
+    from src.base_classes import CollectionVersion
+    from src.logger.models import LoggerModel, LogRollup
+    from src.posts.models import Posts
+    from src.user.models import User
+
+    app.config.from_object(TestConfig if database == 'mongomock' else Config)
+    disconnect(alias='default')
+    disconnect(alias=Config.LOGGER_CONNECTION_SETTINGS['alias'])
+    MongoEngine(app)
+
+    stream_handlers = [
+        handler for handler in logger.handlers
+        if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler)
+    ]
+    devnull = open(os.devnull, 'w')
+    streams = [handler.setStream(devnull) for handler in stream_handlers]
+
+    models = (Posts, User, LoggerModel, LogRollup, CollectionVersion) if database == 'mongomock' else ()
+    for model in models:
+        model.drop_collection()
+
+    try:
+        with app.app_context():
+            yield app
+    finally:
+        for model in models:
+            model.drop_collection()
+
+        for handler, stream in zip(stream_handlers, streams):
+            handler.setStream(stream)
+        devnull.close()
+
+        app.config.from_object(Config)
+
+
+def save_results(path: str, results: list[dict]) -> None:
+    with open(path, 'w') as file:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results
+        }, file, indent=2)
+
+
+def load_results(path: str) -> list[dict]:
+    with open(path) as file:
+        return json.load(file)['results']
+
+
+def compare_results(baseline: list[dict], results: list[dict], threshold: float = 0.1) -> list[dict]:
+    """
+    Returns the change of throughput and median latency of every case present
+    in both runs. A case regressed when its throughput dropped or its median
+    latency grew by more than threshold
+    """
+    baseline = {result['name']: result for result in baseline}
+    comparison = []
+
+    for result in results:
+        if result['name'] not in baseline:
+            continue
+
+        old_result = baseline[result['name']]
+        throughput_change = result['ops_per_second'] / old_result['ops_per_second'] - 1
+        latency_change = result['p50_us'] / old_result['p50_us'] - 1
+
+        comparison.append({
+            'name': result['name'],
+            'throughput_change': throughput_change,
+            'latency_change': latency_change,
+            'regressed': throughput_change < -threshold or latency_change > threshold
+        })
+
+    return comparison
+
+
+def print_results(results: list[dict]) -> None:
+    print(f'{"case":<44}{"ops/s":>12}{"mean, us":>12}{"p50, us":>12}{"p99, us":>12}')
+    for result in results:
+        print(
+            f'{result["name"]:<44}{result["ops_per_second"]:>12.1f}{result["mean_us"]:>12.2f}'
+            f'{result["p50_us"]:>12.2f}{result["p99_us"]:>12.2f}'
+        )
+
+
+def print_comparison(comparison: list[dict]) -> None:
+    print(f'{"case":<44}{"ops/s":>12}{"p50":>12}')
+    for row in comparison:
+        print(
+            f'{row["name"]:<44}{row["throughput_change"]:>+12.1%}{row["latency_change"]:>+12.1%}'
+            f'{"  REGRESSION" if row["regressed"] else ""}'
+        )
@@ -0,0 +1,17 @@
+import importlib.util
+import os
+import sys
+
+# Importing the src package builds the Flask app, connects to MongoDB and sets up the
+# logger of the workers, so it is registered without running its __init__: the
+# collector only needs its own sinks
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+SRC_SPEC = importlib.util.spec_from_file_location(
+    'src', os.path.join(SRC_PATH, '__init__.py'), submodule_search_locations=[SRC_PATH]
+)
+sys.modules['src'] = importlib.util.module_from_spec(SRC_SPEC)
+
+from src.logger.collector import main  # noqa: E402
+
+if __name__ == '__main__':
+    main()
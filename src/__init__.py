@@ -3,9 +3,11 @@ from flask import Flask
 from flask_jwt_extended import JWTManager
 from flask_restful import Api
 from flask_mongoengine import MongoEngine
+from pymongo import monitoring
 
 from src.config import Config
 from src.logger.logger import LoggerFactory, LoggerMessageTemplates
+from src.metrics.metrics import MongoCommandListener, MongoPoolListener
 
 logger = LoggerFactory.get_logger('logging/py.log', 'INFO')
 
@@ -13,6 +15,16 @@ logger = LoggerFactory.get_logger('logging/py.log', 'INFO')
 app = Flask(__name__)
 
 app.config.from_object(Config)
+
+# Listeners only apply to clients created after they are registered
+if Config.METRICS_SETTINGS['enabled']:
+    monitoring.register(MongoCommandListener())
+
+    # a listener per connection, so the pool metrics are labelled with its alias
+    app.config['MONGODB_SETTINGS'] = [
+        {**settings, 'event_listeners': [MongoPoolListener(settings['alias'])]} for settings in Config.MONGODB_SETTINGS
+    ]
+
 db = MongoEngine(app)
 
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'you-will-never-know')
@@ -20,4 +32,5 @@ jwt = JWTManager(app)
 api = Api(app)
 
 from src.logger.views import logs
+from src.metrics.views import metrics
 from src import routes
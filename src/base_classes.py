@@ -1,4 +1,7 @@
-from mongoengine import Document, ValidationError
+from datetime import datetime, UTC
+from typing import Optional
+
+from mongoengine import DateTimeField, Document, IntField, StringField, ValidationError
 
 
 class BaseModel(Document):
@@ -23,3 +26,44 @@ class BaseModel(Document):
         for key, value in fields.items():
             if key not in cls._fields:
                 raise ValidationError(f"'{key}' is not a valid field")
+
+
+class CollectionVersion(Document):
+    """
+        description:
+            Change counter of a collection, bumped on every write to it.
+            Lets readers tell whether anything changed without querying
+            the collection itself.
+
+        methods:
+            bump: increments the version of the named collection and
+            records the time of the change.
+
+            get_version: returns the version and the time of the last
+            change of the named collection.
+    """
+    name = StringField(primary_key=True)
+    version = IntField(default=0)
+    updated_at = DateTimeField()
+
+    meta = {'collection': 'collection_versions'}
+
+    @classmethod
+    def bump(cls, name: str) -> None:
+        cls.objects(name=name).update_one(inc__version=1, set__updated_at=utcnow(), upsert=True)
+
+    @classmethod
+    def get_version(cls, name: str) -> tuple[int, Optional[datetime]]:
+        collection_version = cls.objects(name=name).as_pymongo().first()
+
+        if not collection_version:
+            return 0, None
+
+        return collection_version['version'], collection_version.get('updated_at')
+
+
+def utcnow() -> datetime:
+    """
+    Naive UTC time, as MongoDB returns stored dates
+    """
+    return datetime.now(UTC).replace(tzinfo=None)
@@ -3,22 +3,160 @@ import os
 from mongomock.mongo_client import MongoClient
 
 
+DATABASE_URI = (
+    f'mongodb://{os.environ.get('MONGO_INITDB_ROOT_USERNAME', 'root')}:'
+    f'{os.environ.get('MONGO_INITDB_ROOT_PASSWORD', 'example')}@'
+    f'{os.environ.get('DB_HOST', 'localhost')}:'
+    f'{os.environ.get('DB_PORT', 27017)}/'
+    f'{os.environ.get('DB_NAME', 'flask_db')}?authSource=admin'
+)
+
+
+def parse_write_concern(value: str):
+    return int(value) if value.isdigit() else value
+
+
 class Config:
-    MONGODB_SETTINGS = {
-        'db': os.environ.get('DB_NAME', 'flask_db'),
-        'host': f'mongodb://{os.environ.get('MONGO_INITDB_ROOT_USERNAME', 'root')}:'
-                f'{os.environ.get('MONGO_INITDB_ROOT_PASSWORD', 'example')}@'
-                f'{os.environ.get('DB_HOST', 'localhost')}:'
-                f'{os.environ.get('DB_PORT', 27017)}/'
-                f'{os.environ.get('DB_NAME', 'flask_db')}?authSource=admin'
+    # Logs are written through their own connection, so a burst of log writes
+    # waits for the connections of its own pool instead of the app queries
+    LOGGER_CONNECTION_SETTINGS = {
+        'alias': 'logs',
+        'max_pool_size': int(os.environ.get('LOG_DB_MAX_POOL_SIZE', 10)),
+        'wait_queue_timeout': float(os.environ.get('LOG_DB_WAIT_QUEUE_TIMEOUT', 1.0)),
+        # w per log level, 0 for unacknowledged writes
+        'write_concerns': {
+            level: parse_write_concern(os.environ.get(f'LOG_DB_WRITE_CONCERN_{level}', '1'))
+            for level in ('INFO', 'WARNING', 'ERROR', 'CRITICAL')
+        },
+    }
+
+    MONGODB_SETTINGS = [
+        {
+            'alias': 'default',
+            'db': os.environ.get('DB_NAME', 'flask_db'),
+            'host': DATABASE_URI,
+            'maxPoolSize': int(os.environ.get('DB_MAX_POOL_SIZE', 100)),
+        },
+        {
+            'alias': LOGGER_CONNECTION_SETTINGS['alias'],
+            'db': os.environ.get('DB_NAME', 'flask_db'),
+            'host': DATABASE_URI,
+            'maxPoolSize': LOGGER_CONNECTION_SETTINGS['max_pool_size'],
+            'waitQueueTimeoutMS': int(LOGGER_CONNECTION_SETTINGS['wait_queue_timeout'] * 1000),
+        },
+    ]
+
+    PASSWORD_HASHING_SETTINGS = {
+        'rounds': int(os.environ.get('BCRYPT_ROUNDS', 12)),
+        'workers': int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1)),
+        'max_pending': int(os.environ.get('PASSWORD_HASHING_MAX_PENDING', 4 * (os.cpu_count() or 1))),
+        'timeout': float(os.environ.get('PASSWORD_HASHING_TIMEOUT', 10)),
+    }
+
+    # The identity claims let authenticated requests skip the user lookup, at the cost
+    # of serving the name and email from the token until it expires
+    USER_CACHE_SETTINGS = {
+        'enabled': os.environ.get('USER_CACHE_ENABLED', 'true').lower() == 'true',
+        'max_size': int(os.environ.get('USER_CACHE_MAX_SIZE', 1024)),
+        'ttl': float(os.environ.get('USER_CACHE_TTL', 60)),
+        'jwt_identity_claims': os.environ.get('JWT_IDENTITY_CLAIMS', 'false').lower() == 'true',
+    }
+
+    LOGGER_DATABASE_SETTINGS = {
+        'async': os.environ.get('LOG_DB_ASYNC', 'false').lower() == 'true',
+        'batch_size': int(os.environ.get('LOG_DB_BATCH_SIZE', 100)),
+        'max_latency': float(os.environ.get('LOG_DB_MAX_LATENCY', 0.5)),
+        'queue_size': int(os.environ.get('LOG_DB_QUEUE_SIZE', 10000)),
+        'overflow_policy': os.environ.get('LOG_DB_OVERFLOW_POLICY', 'block'),
+    }
+
+    LOGGER_STORAGE_SETTINGS = {
+        'mode': os.environ.get('LOG_STORAGE_MODE', 'default'),
+        'retention_days': {
+            level: int(os.environ.get(f'LOG_RETENTION_{level}_DAYS', days))
+            for level, days in (('INFO', 7), ('WARNING', 30), ('ERROR', 90), ('CRITICAL', 90))
+        },
+        'max_size': int(os.environ.get('LOG_CAPPED_MAX_SIZE', 1024 * 1024 * 1024)),
+        'max_documents': int(os.environ.get('LOG_CAPPED_MAX_DOCUMENTS', 0)) or None,
+    }
+
+    LOGGER_ROLLUP_SETTINGS = {
+        'flush_interval': float(os.environ.get('LOG_ROLLUP_FLUSH_INTERVAL', 1.0)),
+    }
+
+    LOGGER_FILE_SETTINGS = {
+        'max_bytes': int(os.environ.get('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024)),
+        'interval': int(os.environ.get('LOG_FILE_ROTATION_INTERVAL', 24 * 60 * 60)),
+        'backup_count': int(os.environ.get('LOG_FILE_BACKUP_COUNT', 30)),
+        'max_age': int(os.environ.get('LOG_FILE_MAX_AGE', 30 * 24 * 60 * 60)),
+        'compression': os.environ.get('LOG_FILE_COMPRESSION', 'gzip') or None,
+    }
+
+    LOGGER_BUFFER_SETTINGS = {
+        'enabled': os.environ.get('LOG_BUFFERED', 'false').lower() == 'true',
+        'buffer_size': int(os.environ.get('LOG_BUFFER_SIZE', 64 * 1024)),
+        'flush_interval': float(os.environ.get('LOG_FLUSH_INTERVAL', 1.0)),
+        'flush_level': os.environ.get('LOG_FLUSH_LEVEL', 'ERROR'),
+        'fsync_policy': os.environ.get('LOG_FSYNC_POLICY', 'never'),
+        'fsync_interval': float(os.environ.get('LOG_FSYNC_INTERVAL', 1.0)),
+    }
+
+    LOGGER_SPOOL_SETTINGS = {
+        'enabled': os.environ.get('LOG_SPOOL', 'false').lower() == 'true',
+        'directory': os.environ.get('LOG_SPOOL_DIRECTORY', 'logging/spool'),
+        'segment_size': int(os.environ.get('LOG_SPOOL_SEGMENT_SIZE', 16 * 1024 * 1024)),
+        'max_segments': int(os.environ.get('LOG_SPOOL_MAX_SEGMENTS', 64)),
+        'slow_threshold': float(os.environ.get('LOG_SPOOL_SLOW_THRESHOLD', 0.5)),
+        'replay_batch_size': int(os.environ.get('LOG_SPOOL_REPLAY_BATCH_SIZE', 500)),
+        'replay_interval': float(os.environ.get('LOG_SPOOL_REPLAY_INTERVAL', 1.0)),
+    }
+
+    LOGGER_COLLECTOR_SETTINGS = {
+        'enabled': os.environ.get('LOG_COLLECTOR', 'false').lower() == 'true',
+        'socket_path': os.environ.get('LOG_COLLECTOR_SOCKET', 'logging/collector.sock'),
+        'queue_size': int(os.environ.get('LOG_COLLECTOR_QUEUE_SIZE', 10000)),
+    }
+
+    LOGGER_STREAM_SETTINGS = {
+        'enabled': os.environ.get('LOG_STREAM', 'true').lower() == 'true',
+        'queue_size': int(os.environ.get('LOG_STREAM_QUEUE_SIZE', 1000)),
+        'max_subscribers': int(os.environ.get('LOG_STREAM_MAX_SUBSCRIBERS', 100)),
+        'heartbeat_interval': float(os.environ.get('LOG_STREAM_HEARTBEAT_INTERVAL', 15)),
+    }
+
+    LOGGER_SAMPLING_SETTINGS = {
+        'enabled': os.environ.get('LOG_SAMPLING', 'false').lower() == 'true',
+        # template=ratio pairs, e.g. endpoint_was_called=0.01,user_entered_the_endpoint=0.1
+        'ratios': {
+            template.strip(): float(ratio)
+            for template, ratio in (
+                pair.split('=') for pair in os.environ.get('LOG_SAMPLING_RATIOS', '').split(',') if pair.strip()
+            )
+        },
+        'rate': float(os.environ.get('LOG_RATE_LIMIT', 0)),
+        'burst': float(os.environ.get('LOG_RATE_LIMIT_BURST', 10)),
+        'passthrough_level': os.environ.get('LOG_SAMPLING_PASSTHROUGH_LEVEL', 'ERROR'),
+        'summary_interval': float(os.environ.get('LOG_SAMPLING_SUMMARY_INTERVAL', 60)),
+    }
+
+    METRICS_SETTINGS = {
+        'enabled': os.environ.get('METRICS_ENABLED', 'true').lower() == 'true',
     }
 
 
 class TestConfig(Config):
     TESTING = True
-    MONGODB_SETTINGS = {
-        'db': os.environ.get('DB_NAME', 'flask_db') + '_test',
-        'host': 'localhost',
-        'mongo_client_class': MongoClient,
-        'alias': 'default'
+    MONGODB_SETTINGS = [
+        {
+            'db': os.environ.get('DB_NAME', 'flask_db') + '_test',
+            'host': 'localhost',
+            'mongo_client_class': MongoClient,
+            'alias': alias
+        }
+        for alias in ('default', Config.LOGGER_CONNECTION_SETTINGS['alias'])
+    ]
+    PASSWORD_HASHING_SETTINGS = {
+        **Config.PASSWORD_HASHING_SETTINGS,
+        'rounds': 4,
+        'workers': 0,
     }
@@ -0,0 +1,167 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+from datetime import datetime, UTC
+from typing import Optional
+
+from src.logger.models import LogRollup
+from src.logger.search import tokenize
+
+
+class TooManySubscribers(Exception):
+    """
+    Raised instead of subscribing once max_subscribers
+    clients are already streaming logs
+    """
+
+
+class LogSubscription:
+    """
+        description:
+            Bounded queue of the log events of one /logs/stream client that
+            match its filters: the minimum level, the endpoint (compared with
+            ids replaced by '<id>', like the log rollups) and the search
+            tokens, of which the message must contain at least one (like the
+            log search).
+
+            A client that falls queue_size events behind is dropped, so a
+            slow client never makes the logging threads wait.
+
+        methods:
+            get: returns the next event, None when none arrived within
+            timeout seconds.
+
+            close: unsubscribes the client.
+    """
+    def __init__(
+            self,
+            broadcaster: 'LogBroadcaster',
+            level: int = logging.NOTSET,
+            endpoint: Optional[str] = None,
+            search: str = '',
+            queue_size: int = 1000
+    ):
+        self.level = level
+        self.endpoint = LogRollup.normalize_endpoint(endpoint)
+        self.search_tokens = frozenset(tokenize(search))
+        self.dropped = False
+
+        self._broadcaster = broadcaster
+        self._queue = queue.Queue(queue_size)
+
+    def matches(self, event: dict, endpoint: Optional[str], tokens: frozenset) -> bool:
+        return (
+            event['levelno'] >= self.level
+            and (self.endpoint is None or endpoint == self.endpoint)
+            and (not self.search_tokens or not self.search_tokens.isdisjoint(tokens))
+        )
+
+    def put(self, event: dict) -> bool:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped = True
+
+        return not self.dropped
+
+    def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self._broadcaster.unsubscribe(self)
+
+
+class LogBroadcaster(logging.Handler):
+    """
+        description:
+            Fans the records of the process out to the /logs/stream clients.
+            emit() runs on the logging thread, so it does no I/O: it builds
+            the event of a record once (only when somebody is subscribed) and
+            puts it, without blocking, in the queue of every subscription
+            whose filters it matches. Subscriptions whose queue is full are
+            dropped on the spot.
+
+        methods:
+            subscribe: registers a client, raises TooManySubscribers past
+            max_subscribers.
+
+            unsubscribe: forgets a client.
+    """
+    def __init__(self, queue_size: int = 1000, max_subscribers: int = 100):
+        super().__init__()
+
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+
+        # replaced, never mutated, so emit() reads it without the lock
+        self._subscriptions: tuple[LogSubscription, ...] = ()
+        self._lock = threading.Lock()
+        self._event_ids = itertools.count(1)
+
+    def subscribe(
+            self,
+            level: int = logging.NOTSET,
+            endpoint: Optional[str] = None,
+            search: str = ''
+    ) -> LogSubscription:
+        subscription = LogSubscription(self, level, endpoint, search, self.queue_size)
+
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                raise TooManySubscribers('Too many clients are streaming logs')
+
+            self._subscriptions += (subscription,)
+
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription) -> None:
+        with self._lock:
+            self._subscriptions = tuple(item for item in self._subscriptions if item is not subscription)
+
+    def emit(self, record):
+        subscriptions = self._subscriptions
+        if not subscriptions:
+            return
+
+        try:
+            event = self.get_event(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        params = event['params'] or {}
+        endpoint = LogRollup.normalize_endpoint(params.get('endpoint'))
+        tokens = frozenset(tokenize(event['message'])) if any(item.search_tokens for item in subscriptions) else None
+
+        dropped = [
+            subscription for subscription in subscriptions
+            if subscription.matches(event, endpoint, tokens) and not subscription.put(event)
+        ]
+
+        for subscription in dropped:
+            self.unsubscribe(subscription)
+
+    def get_event(self, record: logging.LogRecord) -> dict:
+        template = getattr(record.msg, 'template', None)
+
+        return {
+            'id': next(self._event_ids),
+            'log_file': record.name,
+            'log_type': record.levelname,
+            'levelno': record.levelno,
+            'message': record.getMessage(),
+            'data_and_time': datetime.fromtimestamp(record.created, UTC).replace(tzinfo=None).isoformat(),
+            'template': template,
+            'params': record.msg.params if template else None
+        }
+
+    @staticmethod
+    def format_event(event: dict) -> str:
+        data = json.dumps({key: value for key, value in event.items() if key != 'levelno'}, default=str)
+
+        return f'id: {event['id']}\ndata: {data}\n\n'
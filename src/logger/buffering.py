@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+from typing import TextIO, Union
+
+from src.logger.rotation import RotatingCompressedFileHandler
+
+FSYNC_POLICIES = ('never', 'interval', 'always')
+
+
+class CoalescingWriter:
+    """
+        description:
+            Wraps a text stream and keeps written lines in memory until
+            flush() writes them to the stream with a single write call.
+            flush() also fsyncs the underlying file according to the
+            policy:
+
+            never: leaves it to the operating system.
+
+            interval: at most once every fsync_interval seconds.
+
+            always: on every flush.
+    """
+    def __init__(self, stream: TextIO, fsync_policy: str = 'never', fsync_interval: float = 1.0):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"'{fsync_policy}' is not a valid fsync policy")
+
+        self.stream = stream
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.buffered = 0
+
+        self._buffer = []
+        self._last_fsync = time.monotonic()
+
+    @property
+    def closed(self) -> bool:
+        return self.stream.closed
+
+    def fileno(self) -> int:
+        return self.stream.fileno()
+
+    def tell(self) -> int:
+        return self.stream.tell() + self.buffered
+
+    def write(self, text: str) -> None:
+        self._buffer.append(text)
+        self.buffered += len(text)
+
+    def flush(self) -> None:
+        if self._buffer:
+            self.stream.write(''.join(self._buffer))
+            self._buffer.clear()
+            self.buffered = 0
+
+        self.stream.flush()
+
+        if self.fsync_policy == 'always' or (
+                self.fsync_policy == 'interval' and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            self.__fsync()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.stream.close()
+
+    def __fsync(self) -> None:
+        self._last_fsync = time.monotonic()
+
+        try:
+            os.fsync(self.stream.fileno())
+        except (OSError, ValueError):
+            # Terminals, pipes and in-memory streams can't be synced
+            pass
+
+
+class BufferedHandlerMixin:
+    """
+        description:
+            Makes a stream based handler coalesce its writes. Formatted records
+            are collected in a CoalescingWriter and written out once the buffer
+            reaches buffer_size characters, once flush_interval seconds have
+            passed (checked on every record and by a background flusher), or
+            right away for records of flush_level and above.
+            With the 'always' fsync policy every record is flushed and synced.
+    """
+    def __init__(
+            self,
+            *args,
+            buffer_size: int = 64 * 1024,
+            flush_interval: float = 1.0,
+            flush_level: Union[int, str] = logging.ERROR,
+            fsync_policy: str = 'never',
+            fsync_interval: float = 1.0,
+            **kwargs
+    ):
+        # FileHandler opens its stream in __init__, so the writer settings go first
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = logging.getLevelName(flush_level) if isinstance(flush_level, str) else flush_level
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+
+        self._emitting = False
+        self._last_flush = time.monotonic()
+        self._stopped = threading.Event()
+
+        super().__init__(*args, **kwargs)
+
+        if self.stream is not None and not isinstance(self.stream, CoalescingWriter):
+            self.stream = self.__wrap(self.stream)
+
+        self._flusher = threading.Thread(target=self.__run_flusher, name='BufferedHandlerFlusher', daemon=True)
+        self._flusher.start()
+
+    def _open(self) -> CoalescingWriter:
+        return self.__wrap(super()._open())
+
+    def emit(self, record):
+        self._emitting = True
+        try:
+            super().emit(record)
+        finally:
+            self._emitting = False
+
+        if self.stream is None:
+            return
+
+        if (
+                self.fsync_policy == 'always'
+                or record.levelno >= self.flush_level
+                or self.stream.buffered >= self.buffer_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.__flush_buffer()
+
+    def flush(self):
+        # StreamHandler.emit flushes after every record, emit() decides instead
+        if self._emitting:
+            return
+
+        with self.lock:
+            self.__flush_buffer()
+
+    def close(self):
+        self._stopped.set()
+        super().close()
+
+    def __wrap(self, stream: TextIO) -> CoalescingWriter:
+        return CoalescingWriter(stream, self.fsync_policy, self.fsync_interval)
+
+    def __flush_buffer(self) -> None:
+        self._last_flush = time.monotonic()
+
+        if self.stream is not None and not self.stream.closed:
+            self.stream.flush()
+
+    def __run_flusher(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+
+class BufferedStreamHandler(BufferedHandlerMixin, logging.StreamHandler):
+    pass
+
+
+class BufferedRotatingFileHandler(BufferedHandlerMixin, RotatingCompressedFileHandler):
+    pass
@@ -0,0 +1,206 @@
+"""
+Log collector: one process that owns the log sinks for every worker process.
+
+Workers started with LOG_COLLECTOR=true log through CollectorClientHandler,
+which queues records in memory and sends them over a Unix socket from a
+background thread. The collector writes them to the file, stream and
+(batched) database handlers. Start it before the workers:
+
+    python collector.py
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import signal
+import socketserver
+import struct
+import threading
+from typing import Iterable, Optional
+
+import mongoengine
+
+from src.config import Config
+
+FRAME_HEADER = struct.Struct('>L')
+# larger frames can only come from a corrupted stream, the connection is closed instead of reading them
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# LogRecord attributes sent to the collector, the message and its structured fields are added to them
+RECORD_FIELDS = (
+    'name', 'levelno', 'levelname', 'pathname', 'filename', 'module', 'lineno', 'funcName',
+    'created', 'msecs', 'relativeCreated', 'thread', 'threadName', 'process', 'processName'
+)
+
+
+def serialize_record(record: logging.LogRecord) -> bytes:
+    fields = {field: getattr(record, field, None) for field in RECORD_FIELDS}
+    fields['msg'] = record.getMessage()
+    fields['template'] = getattr(record.msg, 'template', None)
+    fields['params'] = record.msg.params if fields['template'] else None
+
+    if record.exc_info:
+        fields['msg'] += '\n' + logging.Formatter().formatException(record.exc_info)
+
+    data = json.dumps(fields, default=str).encode('utf-8')
+
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+def deserialize_record(data: bytes) -> logging.LogRecord:
+    from src.logger.logger import LogMessage
+
+    fields = json.loads(data)
+    template, params = fields.pop('template'), fields.pop('params')
+
+    if template:
+        message = LogMessage(template, params)
+        message._text = fields['msg']  # rendered by the worker already
+        fields['msg'] = message
+
+    return logging.makeLogRecord(fields)
+
+
+class CollectorSocketHandler(logging.handlers.SocketHandler):
+    """
+    SocketHandler over a Unix socket that frames records as JSON instead of
+    pickles. While the collector is unreachable records are dropped and the
+    connection is retried with the SocketHandler backoff.
+    """
+    def __init__(self, socket_path: str):
+        super().__init__(socket_path, None)
+
+    def makePickle(self, record):
+        return serialize_record(record)
+
+
+class CollectorClientHandler(logging.handlers.QueueHandler):
+    """
+        description:
+            Worker side of the collector. emit() only puts the record on a
+            bounded in-memory queue, a QueueListener thread sends it to the
+            collector, so the request threads never wait on sink I/O or the
+            socket. Records that do not fit in the queue are counted in
+            `dropped`.
+
+        methods:
+            close: sends the queued records and stops the sending thread.
+    """
+    def __init__(self, socket_path: str, queue_size: int = 10000):
+        super().__init__(queue.Queue(queue_size))
+
+        self.dropped = 0
+        self.socket_handler = CollectorSocketHandler(socket_path)
+
+        self._listener = logging.handlers.QueueListener(self.queue, self.socket_handler)
+        self._listener.start()
+        self._closed = False
+
+    def prepare(self, record):
+        # unlike QueueHandler, the record keeps its LogMessage (with the params
+        # LogMessageFilter resolved on the calling thread) for the structured fields
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._listener.stop()
+
+        self.socket_handler.close()
+        super().close()
+
+
+class LogCollector(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        description:
+            Unix socket server that receives records from the workers and
+            hands them to its sink handlers. Each worker connection is read
+            by its own thread; the handlers serialize writes with their locks,
+            so lines from different workers never interleave.
+
+        methods:
+            handle_record: passes a received record to the handlers that
+            accept its level.
+
+            close: stops serving and flushes and closes the handlers.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, handlers: Iterable[logging.Handler]):
+        self.socket_path = socket_path
+        self.handlers = list(handlers)
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        super().__init__(socket_path, CollectorRequestHandler)
+
+    def handle_record(self, record: logging.LogRecord) -> None:
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+        for handler in self.handlers:
+            handler.flush()
+            handler.close()
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class CollectorRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = self.rfile.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+
+            length = FRAME_HEADER.unpack(header)[0]
+            if length > MAX_FRAME_SIZE:
+                return
+
+            data = self.rfile.read(length)
+            if len(data) < length:
+                return
+
+            self.server.handle_record(deserialize_record(data))
+
+
+def create_sink_handlers(log_file: str, log_format: Optional[str] = None) -> list[logging.Handler]:
+    """
+    Connects to the logs database and creates the sinks of the collector,
+    without the Flask app and the logger of the workers
+    """
+    from src.logger.logger import LoggerFactory
+
+    alias = Config.LOGGER_CONNECTION_SETTINGS['alias']
+    mongoengine.connect(**next(settings for settings in Config.MONGODB_SETTINGS if settings['alias'] == alias))
+
+    return LoggerFactory.create_sink_handlers(log_file, log_format, database_async=True)
+
+
+def main(log_file: str = 'logging/py.log', log_format: Optional[str] = None) -> None:
+    settings = Config.LOGGER_COLLECTOR_SETTINGS
+    collector = LogCollector(settings['socket_path'], create_sink_handlers(log_file, log_format))
+
+    serving = threading.Thread(target=collector.serve_forever, name='LogCollector')
+    serving.start()
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+
+    stopped.wait()
+    collector.close()
+    serving.join()
@@ -0,0 +1,182 @@
+"""
+Streaming export of the logs of a [from, to) window as NDJSON or CSV,
+gzip-compressed on the fly. The logs are read from a raw pymongo cursor
+in batches and encoded one at a time, so memory use does not depend on
+the size of the export. The dates are naive UTC, like the stored ones.
+Served by GET /logs/export, or from the command line:
+
+    python export_logs.py --from 2024-05-01T00:00 --to 2024-05-02T00:00 --level ERROR --output errors.ndjson.gz
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from src.logger.models import LoggerModel
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# exported column and the logger_model field it is read from, named like LoggerModel.to_json
+EXPORT_FIELDS = {
+    'log_id': '_id',
+    'log_file': 'log_file',
+    'log_type': 'info_type',
+    'message': 'message',
+    'data_and_time': 'date_and_time',
+    'template': 'template',
+    'params': 'params',
+}
+LEVELS = LoggerModel.info_type.choices
+
+BATCH_SIZE = 1000
+GZIP_CHUNK_SIZE = 64 * 1024
+
+
+def parse_levels(levels: Optional[str]) -> Optional[list[str]]:
+    """
+    Parses a comma-separated list of levels, None for every level
+    """
+    if not levels:
+        return None
+
+    parsed = [level.strip().upper() for level in levels.split(',') if level.strip()]
+    invalid = [level for level in parsed if level not in LEVELS]
+    if invalid:
+        raise ValueError(f"{', '.join(invalid)} not valid levels, expected some of {', '.join(LEVELS)}")
+
+    return parsed
+
+
+def iter_logs(
+        date_from: datetime,
+        date_to: datetime,
+        levels: Optional[list[str]] = None,
+        batch_size: int = BATCH_SIZE
+) -> Iterator[dict]:
+    """
+    Yields the raw documents of the logs within [date_from, date_to), oldest
+    first, through the (date_and_time, id) index. The queryset neither builds
+    Documents nor caches the results
+    """
+    queryset = LoggerModel.objects(date_and_time__gte=date_from, date_and_time__lt=date_to)
+    if levels:
+        queryset = queryset.filter(info_type__in=levels)
+
+    yield from (
+        queryset.order_by('date_and_time', 'id')
+        .only(*(field for field in EXPORT_FIELDS.values() if field != '_id'))
+        .no_cache()
+        .as_pymongo()
+        .batch_size(batch_size)
+    )
+
+
+def get_row(document: dict) -> dict:
+    row = {column: document.get(field) for column, field in EXPORT_FIELDS.items()}
+    row['log_id'] = str(row['log_id'])
+
+    if row['data_and_time']:
+        row['data_and_time'] = row['data_and_time'].isoformat()
+
+    return row
+
+
+def encode_ndjson(documents: Iterable[dict]) -> Iterator[str]:
+    for document in documents:
+        yield json.dumps(get_row(document), default=str) + '\n'
+
+
+def encode_csv(documents: Iterable[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(EXPORT_FIELDS))
+
+    writer.writeheader()
+
+    for document in documents:
+        row = get_row(document)
+        row['params'] = json.dumps(row['params'], default=str) if row['params'] else ''
+        writer.writerow(row)
+
+        # hand over the encoded rows, the buffer only ever holds one
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks: Iterable[bytes], chunk_size: int = GZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Compresses a stream into a gzip stream, yielding compressed data
+    in chunks of about chunk_size bytes
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    pending = []
+    pending_size = 0
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if not data:
+            continue
+
+        pending.append(data)
+        pending_size += len(data)
+
+        if pending_size >= chunk_size:
+            yield b''.join(pending)
+            pending, pending_size = [], 0
+
+    pending.append(compressor.flush())
+    yield b''.join(pending)
+
+
+def export_logs(
+        date_from: datetime,
+        date_to: datetime,
+        levels: Optional[list[str]] = None,
+        export_format: str = 'ndjson',
+        compress: bool = True
+) -> Iterator[bytes]:
+    """
+    Yields the encoded (and compressed) logs of [date_from, date_to)
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"'{export_format}' is not a valid format, expected one of {', '.join(EXPORT_FORMATS)}")
+
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+    chunks = (text.encode('utf-8') for text in encode(iter_logs(date_from, date_to, levels)))
+
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def main(arguments: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python export_logs.py', description='Export the logs of a time range')
+    parser.add_argument('--from', dest='date_from', type=datetime.fromisoformat, required=True, help='ISO 8601 start')
+    parser.add_argument('--to', dest='date_to', type=datetime.fromisoformat, required=True, help='ISO 8601 end')
+    parser.add_argument('--level', help='comma-separated levels, all by default')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson', help='encoding of the logs')
+    parser.add_argument('--no-gzip', action='store_true', help='write the logs uncompressed')
+    parser.add_argument('--output', metavar='PATH', help='file to write, standard output by default')
+    arguments = parser.parse_args(arguments)
+
+    try:
+        levels = parse_levels(arguments.level)
+    except ValueError as exception:
+        parser.error(str(exception))
+
+    chunks = export_logs(arguments.date_from, arguments.date_to, levels, arguments.format, not arguments.no_gzip)
+    output = open(arguments.output, 'wb') if arguments.output else sys.stdout.buffer
+
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if arguments.output:
+            output.close()
+
+    return 0
@@ -1,28 +1,309 @@
+import atexit
 import logging
-from typing import Optional
-
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, UTC
+from typing import Callable, Optional, Union
+
+from bson import ObjectId
 from flask import request
 
 from src.base_classes import BaseModel
-from src.logger.models import LoggerModel
+from src.config import Config
+from src.logger.broadcast import LogBroadcaster
+from src.logger.buffering import BufferedRotatingFileHandler, BufferedStreamHandler
+from src.logger.collector import CollectorClientHandler
+from src.logger.models import LoggerModel, SUPPRESSED_TEMPLATE
+from src.logger.rotation import RotatingCompressedFileHandler
+from src.logger.sampling import SamplingFilter
+from src.logger.spool import LogSpool
+from src.metrics.metrics import LOG_DATABASE_BATCH_DURATION, instrument_handler
 from src.user.models import User
 
 
+class LogMessage:
+    """
+        description:
+            Structured log message passed to the logger instead of a
+            pre-formatted string: a LoggerMessageTemplates key and its
+            parameters. The text is rendered on the first str() call (by
+            a formatter or by the database handler) and cached, so it is
+            formatted at most once per record.
+
+            params may be given as a callable. It is only called when the
+            params are first read, which LogMessageFilter does once a
+            handler is known to accept the record.
+    """
+    __slots__ = ('template', '_params', '_text')
+
+    def __init__(self, template: str, params: Union[dict, Callable[[], dict]]):
+        self.template = template
+        self._params = params
+        self._text = None
+
+    @property
+    def params(self) -> dict:
+        if callable(self._params):
+            self._params = self._params()
+
+        return self._params
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = LoggerMessageTemplates.render(self.template, self.params)
+
+        return self._text
+
+    def __repr__(self) -> str:
+        return f'LogMessage({self.template!r}, {self.params!r})'
+
+
+class LogMessageFilter(logging.Filter):
+    """
+        description:
+            Logger filter that drops LogMessage records no handler would
+            accept and resolves the params of the rest. Logger filters run
+            on the calling thread, so the params are read while the request
+            and the logged records are still current, even when the record
+            is written later by a queued handler.
+    """
+    def __init__(self, logger: logging.Logger):
+        super().__init__()
+        self.logger = logger
+
+    def filter(self, record):
+        if not isinstance(record.msg, LogMessage):
+            return True
+
+        if not self.__has_accepting_handler(record.levelno):
+            return False
+
+        record.msg.params  # reads the lazy params now, on the calling thread
+
+        return True
+
+    def __has_accepting_handler(self, level: int) -> bool:
+        logger = self.logger
+
+        while logger:
+            if any(level >= handler.level for handler in logger.handlers):
+                return True
+
+            if not logger.propagate:
+                return False
+
+            logger = logger.parent
+
+        return logging.lastResort is not None and level >= logging.lastResort.level
+
+
 class DatabaseHandler(logging.Handler):
-    def __init__(self):
+    """
+        description:
+            Writes every record to the logs collection. With a LogSpool the
+            writes go through it, so they fall back to the on-disk spool
+            while the database is slow or unavailable.
+    """
+    def __init__(self, spool: Optional[LogSpool] = None):
         super().__init__()
+        self.spool = spool
+
+    @staticmethod
+    def get_log_fields(record: logging.LogRecord) -> dict:
+        fields = {
+            # assigned once, so a log written again is recognized as a duplicate
+            'id': ObjectId(),
+            'log_file': record.name,
+            'info_type': record.levelname,
+            'message': record.getMessage(),
+            # naive UTC, like the dates MongoDB returns and the TTL monitor compares expire_at with
+            'date_and_time': datetime.fromtimestamp(record.created, UTC).replace(tzinfo=None)
+        }
+
+        if isinstance(record.msg, LogMessage):
+            fields['template'] = record.msg.template
+            fields['params'] = record.msg.params
+
+        return fields
 
     def emit(self, record):
-        LoggerModel.create_log(
-            log_file=record.name,
-            info_type=record.levelname,
-            message=record.msg,
-            date_and_time=record.asctime
-        )
+        if self.spool:
+            self.spool.write([self.get_log_fields(record)])
+        else:
+            LoggerModel.create_log(**self.get_log_fields(record))
+
+    def close(self):
+        if self.spool:
+            self.spool.close()
+        super().close()
+
+
+class AsyncDatabaseHandler(DatabaseHandler):
+    """
+        description:
+            Database handler that keeps MongoDB out of the request thread.
+            emit() only appends the record to a bounded in-memory queue, a
+            background worker drains it with a single insert_many per batch.
+            A batch is written once it reaches batch_size records or once
+            its oldest record has waited max_latency seconds.
+
+        overflow policies (applied when the queue holds queue_size records):
+            block: the emitting thread waits until the worker frees a slot.
+
+            drop_oldest: the oldest queued record is discarded.
+
+            drop_newest: the incoming record is discarded.
+
+            Discarded records are counted in the `dropped` attribute.
+
+        methods:
+            flush: blocks until every queued record is written.
+
+            close: flushes the queue and stops the worker.
+    """
+    OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(
+            self,
+            batch_size: int = 100,
+            max_latency: float = 0.5,
+            queue_size: int = 10000,
+            overflow_policy: str = 'block',
+            spool: Optional[LogSpool] = None
+    ):
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"'{overflow_policy}' is not a valid overflow policy")
+
+        super().__init__(spool)
+
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._unfinished = 0
+        self._flushing = False
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name='AsyncDatabaseHandler', daemon=True)
+        self._worker.start()
+
+    def emit(self, record):
+        with self._condition:
+            if len(self._queue) >= self.queue_size:
+                if self.overflow_policy == 'drop_newest':
+                    self.dropped += 1
+                    return
+
+                if self.overflow_policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self._unfinished -= 1
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.queue_size and not self._closed:
+                        self._condition.wait()
+
+            self._queue.append(record)
+            self._unfinished += 1
+
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+
+    def flush(self):
+        with self._condition:
+            self._flushing = True
+            self._condition.notify_all()
+
+            while self._unfinished and self._worker.is_alive():
+                self._condition.wait()
+
+            self._flushing = False
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        self._worker.join()
+        super().close()
+
+    def _next_batch(self) -> list:
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+
+            deadline = time.monotonic() + self.max_latency
+
+            while len(self._queue) < self.batch_size and not (self._closed or self._flushing):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._condition.notify_all()
+
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+
+            if not batch:
+                return
+
+            started_at = time.perf_counter()
+            try:
+                logs = [self.get_log_fields(record) for record in batch]
+
+                if self.spool:
+                    self.spool.write(logs)
+                else:
+                    LoggerModel.create_logs(logs)
+            except Exception:
+                self.handleError(batch[-1])
+            finally:
+                LOG_DATABASE_BATCH_DURATION.observe(time.perf_counter() - started_at)
+
+                with self._condition:
+                    self._unfinished -= len(batch)
+                    self._condition.notify_all()
 
 
 class LoggerFactory:
+    """
+        description:
+            Creates the project loggers. Loggers are cached in a registry by
+            log file, so asking for the same logger again never stacks up a
+            second set of handlers (which would write every record several
+            times and leak file descriptors).
+
+        methods:
+            get_logger: returns the configured logger for the log file. When
+            it is called with a different level or format the cached logger
+            is reconfigured in place.
+
+            get_broadcaster: returns the handler that feeds /logs/stream.
+
+            get_stats: returns the settings, handler count and open file
+            descriptors of every registered logger.
+
+            shutdown: closes the filters of every registered logger, so the
+            sampling summaries of the last interval are logged. Runs at exit,
+            before logging flushes and closes the handlers.
+    """
     _LOG = None
+    _REGISTRY: dict[str, dict] = {}
+    _REGISTRY_LOCK = threading.Lock()
+    _BROADCASTER: Optional[LogBroadcaster] = None
+
+    DEFAULT_FORMAT = '%(asctime)s [%(levelname)s]: %(message)s'
+    DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
     @staticmethod
     def __create_logger(log_file: str, log_level: str, log_format: Optional[str] = None):
@@ -30,51 +311,199 @@ class LoggerFactory:
         A private method that interacts with the python
         logging module
         """
-        log_format = log_format or '%(asctime)s [%(levelname)s]: %(message)s'
-
         # Initialize the class variable with logging object
         LoggerFactory._LOG = logging.getLogger(log_file)
         LoggerFactory._LOG.setLevel(logging.NOTSET)  # Set to NOTSET to handle all levels
 
-        # Create a base logging formatter
-        base_formatter = logging.Formatter(log_format, datefmt='%Y-%m-%d %H:%M:%S')
+        # Send the records to the collector process, or write them to the sinks here
+        collector_settings = dict(Config.LOGGER_COLLECTOR_SETTINGS)
+        if collector_settings.pop('enabled'):
+            handlers = [CollectorClientHandler(**collector_settings)]
+        else:
+            handlers = LoggerFactory.create_sink_handlers(log_file, log_format)
+
+        # Push the records of this process to the /logs/stream clients
+        broadcaster = LoggerFactory.get_broadcaster()
+        if broadcaster:
+            handlers.append(broadcaster)
+
+        for handler in handlers:
+            # the broadcaster is shared by every logger and instrumented once, when it is created
+            if Config.METRICS_SETTINGS['enabled'] and handler is not broadcaster:
+                instrument_handler(handler)
+
+            LoggerFactory._LOG.addHandler(handler)
+
+        # Sample high-volume messages before their params are resolved
+        sampling_settings = dict(Config.LOGGER_SAMPLING_SETTINGS)
+        if sampling_settings.pop('enabled'):
+            LoggerFactory._LOG.addFilter(SamplingFilter(LoggerFactory._LOG, **sampling_settings))
+
+        # Resolve lazy messages only for records that will be handled
+        LoggerFactory._LOG.addFilter(LogMessageFilter(LoggerFactory._LOG))
+
+        LoggerFactory.__configure_logger(LoggerFactory._LOG, handlers, log_level, log_format)
+
+        return LoggerFactory._LOG
 
-        # Create a file handler
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(base_formatter)
-        LoggerFactory._LOG.addHandler(file_handler)
+    @staticmethod
+    def create_sink_handlers(
+            log_file: str,
+            log_format: Optional[str] = None,
+            database_async: Optional[bool] = None
+    ) -> list[logging.Handler]:
+        """
+        Creates the file, stream and database handlers that write the
+        records of a logger, in the worker itself or in the collector.
+        database_async overrides LOGGER_DATABASE_SETTINGS['async']
+        """
+        buffer_settings = dict(Config.LOGGER_BUFFER_SETTINGS)
+        is_buffered = buffer_settings.pop('enabled')
+
+        # Create a rotating file handler
+        if is_buffered:
+            file_handler = BufferedRotatingFileHandler(log_file, **Config.LOGGER_FILE_SETTINGS, **buffer_settings)
+        else:
+            file_handler = RotatingCompressedFileHandler(log_file, **Config.LOGGER_FILE_SETTINGS)
 
         # Create a stream handler
-        stream_handler = logging.StreamHandler()
-        stream_handler.setFormatter(base_formatter)
-        LoggerFactory._LOG.addHandler(stream_handler)
+        stream_handler = BufferedStreamHandler(**buffer_settings) if is_buffered else logging.StreamHandler()
 
         # Create a database handler
-        database_handler = DatabaseHandler()
-        stream_handler.setFormatter(base_formatter)
-        LoggerFactory._LOG.addHandler(database_handler)
+        database_handler = LoggerFactory.__create_database_handler(log_file, database_async)
+
+        handlers = [file_handler, stream_handler, database_handler]
+        formatter = logging.Formatter(log_format or LoggerFactory.DEFAULT_FORMAT, datefmt=LoggerFactory.DATE_FORMAT)
+
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        return handlers
+
+    @staticmethod
+    def __configure_logger(
+            logger: logging.Logger,
+            handlers: list[logging.Handler],
+            log_level: str,
+            log_format: Optional[str] = None
+    ) -> None:
+        """
+        A private method that applies the format and the level to
+        an existing logger and its handlers
+        """
+        # Create a base logging formatter
+        base_formatter = logging.Formatter(
+            log_format or LoggerFactory.DEFAULT_FORMAT,
+            datefmt=LoggerFactory.DATE_FORMAT
+        )
+
+        for handler in handlers:
+            handler.setFormatter(base_formatter)
 
         # Set the logging level based on the user selection
         if log_level == 'INFO':
-            LoggerFactory._LOG.setLevel(logging.INFO)
+            logger.setLevel(logging.INFO)
         elif log_level == 'ERROR':
-            LoggerFactory._LOG.setLevel(logging.ERROR)
+            logger.setLevel(logging.ERROR)
         elif log_level == 'DEBUG':
-            LoggerFactory._LOG.setLevel(logging.DEBUG)
+            logger.setLevel(logging.DEBUG)
         else:
-            LoggerFactory._LOG.setLevel(logging.NOTSET)
+            logger.setLevel(logging.NOTSET)
 
-        return LoggerFactory._LOG
+    @staticmethod
+    def __create_database_handler(log_file: str, database_async: Optional[bool] = None) -> DatabaseHandler:
+        """
+        A private method that picks the synchronous or the queue-backed
+        database handler based on Config.LOGGER_DATABASE_SETTINGS, with
+        the on-disk spool of Config.LOGGER_SPOOL_SETTINGS when it is enabled
+        """
+        settings = dict(Config.LOGGER_DATABASE_SETTINGS)
+        is_async = settings.pop('async')
+
+        spool_settings = dict(Config.LOGGER_SPOOL_SETTINGS)
+        spool = None
+        if spool_settings.pop('enabled'):
+            directory = os.path.join(spool_settings.pop('directory'), os.path.basename(log_file))
+            spool = LogSpool(directory, **spool_settings)
+
+        if not (is_async if database_async is None else database_async):
+            return DatabaseHandler(spool)
+
+        return AsyncDatabaseHandler(**settings, spool=spool)
 
     @staticmethod
-    def get_logger(log_file, log_level):
+    def get_logger(log_file, log_level, log_format: Optional[str] = None):
         """
         A static method called by other modules to initialize logging in
         their own module
         """
-        logger = LoggerFactory.__create_logger(log_file, log_level)
+        settings = (log_file, log_level, log_format)
+
+        with LoggerFactory._REGISTRY_LOCK:
+            entry = LoggerFactory._REGISTRY.get(log_file)
+
+            if entry is None:
+                logger = LoggerFactory.__create_logger(log_file, log_level, log_format)
+                LoggerFactory._REGISTRY[log_file] = {
+                    'settings': settings,
+                    'logger': logger,
+                    'handlers': list(logger.handlers)
+                }
+            elif entry['settings'] != settings:
+                LoggerFactory.__configure_logger(entry['logger'], entry['handlers'], log_level, log_format)
+                entry['settings'] = settings
 
-        return logger
+            return LoggerFactory._REGISTRY[log_file]['logger']
+
+    @staticmethod
+    def get_broadcaster() -> Optional[LogBroadcaster]:
+        """
+        Returns the broadcaster shared by the loggers of the process,
+        None when Config.LOGGER_STREAM_SETTINGS disables it
+        """
+        settings = Config.LOGGER_STREAM_SETTINGS
+
+        if settings['enabled'] and LoggerFactory._BROADCASTER is None:
+            LoggerFactory._BROADCASTER = LogBroadcaster(settings['queue_size'], settings['max_subscribers'])
+
+            if Config.METRICS_SETTINGS['enabled']:
+                instrument_handler(LoggerFactory._BROADCASTER)
+
+        return LoggerFactory._BROADCASTER if settings['enabled'] else None
+
+    @staticmethod
+    def get_stats() -> dict:
+        """
+        Returns the settings, handler count and open file descriptors
+        of every logger created by the factory
+        """
+        with LoggerFactory._REGISTRY_LOCK:
+            return {
+                log_file: {
+                    'level': logging.getLevelName(entry['logger'].level),
+                    'format': entry['settings'][2] or LoggerFactory.DEFAULT_FORMAT,
+                    'handlers': len(entry['logger'].handlers),
+                    'open_descriptors': [
+                        handler.stream.fileno() for handler in entry['logger'].handlers
+                        if isinstance(handler, logging.FileHandler) and handler.stream and not handler.stream.closed
+                    ]
+                }
+                for log_file, entry in LoggerFactory._REGISTRY.items()
+            }
+
+    @staticmethod
+    def shutdown() -> None:
+        with LoggerFactory._REGISTRY_LOCK:
+            loggers = [entry['logger'] for entry in LoggerFactory._REGISTRY.values()]
+
+        for logger in loggers:
+            for log_filter in list(logger.filters):
+                if isinstance(log_filter, SamplingFilter):
+                    log_filter.close()
+
+
+# registered after logging's own exit hook, so it runs before the handlers are closed
+atexit.register(LoggerFactory.shutdown)
 
 
 class LoggerMessageTemplates:
@@ -91,7 +520,7 @@ class LoggerMessageTemplates:
     )
     _USER_CHANGED_THE_FIELD = (
             __USER_CREDENTIALS_TEMPLATE +
-            'changed %(field_name)s'
+            'changed %(changed_fields)s'
             ' from %(old_version)s to %(new_version)s at %(table_name)s in %(endpoint)s'
     )
     _USER_DELETED_THE_TABLE_RECORD = (
@@ -100,101 +529,118 @@ class LoggerMessageTemplates:
     )
     _ENDPOINT_WAS_CALLED = '%(endpoint)s was called with method %(method)s'
 
+    _LOG_LINES_SUPPRESSED = (
+            '%(suppressed)s %(sampled_template)s log lines in %(endpoint)s '
+            'with method %(method)s were suppressed by sampling'
+    )
+
     _CREATED_USER = 'User ' + __USER_CREDENTIALS_TEMPLATE + 'was created successfully'
     _USER_LOGGED_IN = 'User ' + __USER_CREDENTIALS_TEMPLATE + 'has logged in'
 
+    TEMPLATES = {
+        'error': _ERROR,
+        'authenticated_user_error': _AUTHENTICATED_USER_ERROR,
+        'user_entered_the_endpoint': _USER_ENTERED_THE_ENDPOINT,
+        'user_created_the_table_record': _USER_CREATED_THE_TABLE_RECORD,
+        'user_changed_the_field': _USER_CHANGED_THE_FIELD,
+        'user_deleted_the_table_record': _USER_DELETED_THE_TABLE_RECORD,
+        'endpoint_was_called': _ENDPOINT_WAS_CALLED,
+        'created_user': _CREATED_USER,
+        'user_logged_in': _USER_LOGGED_IN,
+        SUPPRESSED_TEMPLATE: _LOG_LINES_SUPPRESSED,
+    }
+
     @staticmethod
-    def get_created_user_log(user: User) -> str:
-        return LoggerMessageTemplates._CREATED_USER % {
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-        }
+    def render(template: str, params: dict) -> str:
+        return LoggerMessageTemplates.TEMPLATES[template] % params
 
     @staticmethod
-    def get_logged_user_log(user: User) -> str:
-        return LoggerMessageTemplates._USER_LOGGED_IN % {
+    def __get_user_params(user: User) -> dict:
+        return {
+            'user_id': str(user.id),
             'email': user.email,
             'first_name': user.first_name,
             'last_name': user.last_name,
         }
 
     @staticmethod
-    def get_error_log(error_message: str, request_instance: request) -> str:
-        return LoggerMessageTemplates._ERROR % {
+    def get_created_user_log(user: User) -> LogMessage:
+        return LogMessage('created_user', lambda: LoggerMessageTemplates.__get_user_params(user))
+
+    @staticmethod
+    def get_logged_user_log(user: User) -> LogMessage:
+        return LogMessage('user_logged_in', lambda: LoggerMessageTemplates.__get_user_params(user))
+
+    @staticmethod
+    def get_error_log(error_message: str, request_instance: request) -> LogMessage:
+        return LogMessage('error', lambda: {
             'error': error_message,
             'endpoint': request_instance.path,
             'method': request_instance.method
-        }
+        })
 
     @staticmethod
-    def get_error_with_authenticated_user_log(user: User, request_instance: request, error_message: str) -> str:
-        return LoggerMessageTemplates._AUTHENTICATED_USER_ERROR % {
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
+    def get_error_with_authenticated_user_log(user: User, request_instance: request, error_message: str) -> LogMessage:
+        return LogMessage('authenticated_user_error', lambda: {
+            **LoggerMessageTemplates.__get_user_params(user),
             'error': error_message,
             'endpoint': request_instance.path,
             'method': request_instance.method
-        }
+        })
 
     @staticmethod
-    def get_the_endpoint_enter_log(user: User, request_instance: request) -> str:
-        return LoggerMessageTemplates._USER_ENTERED_THE_ENDPOINT % {
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
+    def get_the_endpoint_enter_log(user: User, request_instance: request) -> LogMessage:
+        return LogMessage('user_entered_the_endpoint', lambda: {
+            **LoggerMessageTemplates.__get_user_params(user),
             'method': request_instance.method,
             'endpoint': request_instance.path
-        }
+        })
 
     @staticmethod
-    def get_created_record_log(user: User, request_instance: request, record: BaseModel) -> str:
-
-        return LoggerMessageTemplates._USER_CREATED_THE_TABLE_RECORD % {
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
+    def get_created_record_log(user: User, request_instance: request, record: BaseModel) -> LogMessage:
+        return LogMessage('user_created_the_table_record', lambda: {
+            **LoggerMessageTemplates.__get_user_params(user),
             'table_name': record.get_table_name(),
-            'record_id': record.id,
-            'endpoint': request_instance.path
-        }
+            'record_id': str(record.id),
+            'endpoint': request_instance.path,
+            'method': request_instance.method
+        })
 
     @staticmethod
     def get_changed_record_log(
             user: User,
             record: BaseModel,
+            old_field_version: dict,
             new_field_version: dict,
             request_instance: request
-    ) -> str:
-        old_field_version = {field: record[field] for field in record._fields if field in new_field_version.keys()}
-
-        return LoggerMessageTemplates._USER_CHANGED_THE_FIELD % {
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'field_name': list(old_field_version.keys()),
-            'old_version': old_field_version,
-            'new_version': new_field_version,
-            'table_name': record.get_table_name(),
-            'record_id': record.id,
-            'endpoint': request_instance.path
-        }
+    ) -> LogMessage:
+        def get_params() -> dict:
+            return {
+                **LoggerMessageTemplates.__get_user_params(user),
+                'changed_fields': list(old_field_version.keys()),
+                'old_version': old_field_version,
+                'new_version': new_field_version,
+                'table_name': record.get_table_name(),
+                'record_id': str(record.id),
+                'endpoint': request_instance.path,
+                'method': request_instance.method
+            }
+
+        return LogMessage('user_changed_the_field', get_params)
 
     @staticmethod
-    def get_deleted_record_log(user: User, request_instance: request, record: BaseModel) -> str:
-        return LoggerMessageTemplates._USER_DELETED_THE_TABLE_RECORD % {
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
+    def get_deleted_record_log(user: User, request_instance: request, record: BaseModel) -> LogMessage:
+        return LogMessage('user_deleted_the_table_record', lambda: {
+            **LoggerMessageTemplates.__get_user_params(user),
             'table_name': record.get_table_name(),
-            'record_id': record.id,
-            'endpoint': request_instance.path
-        }
+            'record_id': str(record.id),
+            'endpoint': request_instance.path,
+            'method': request_instance.method
+        })
 
     @staticmethod
-    def get_endpoint_was_called_log(request_instance: request,) -> str:
-        return LoggerMessageTemplates._ENDPOINT_WAS_CALLED % {
+    def get_endpoint_was_called_log(request_instance: request,) -> LogMessage:
+        return LogMessage('endpoint_was_called', lambda: {
             'endpoint': request_instance.path,
             'method': request_instance.method
-        }
+        })
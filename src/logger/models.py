@@ -1,21 +1,342 @@
-from typing import override
+import atexit
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import override, Iterable, Optional
 
-from mongoengine import Document, StringField, DateTimeField
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine import Document, StringField, DateTimeField, DictField, IntField, ListField, Q, ValidationError
+from mongomock.mongo_client import MongoClient as MockMongoClient
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError
+
+from src.base_classes import utcnow
+from src.config import Config
+from src.logger.search import InvertedIndex, extract_search_terms
+
+SORTABLE_FIELDS = ('date_and_time', 'log_file', 'info_type')
+STORAGE_MODES = ('default', 'capped', 'timeseries')
+SUPPRESSED_TEMPLATE = 'log_lines_suppressed'
+
+
+def get_write_concern(info_type: Optional[str]):
+    """
+    Returns the write concern w of Config.LOGGER_CONNECTION_SETTINGS for a log level
+    """
+    return Config.LOGGER_CONNECTION_SETTINGS['write_concerns'].get(info_type, 1)
+
+
+def get_storage_meta(settings: dict) -> dict:
+    """
+    Builds the LoggerModel meta for a storage mode of Config.LOGGER_STORAGE_SETTINGS:
+
+        default: regular collection, every log expires through a TTL index on
+        expire_at after the retention of its level.
+
+        capped: capped collection bounded by max_size bytes and max_documents.
+        Capped collections can't have TTL indexes, the oldest logs are
+        overwritten instead.
+
+        timeseries: time series collection on date_and_time that expires
+        logs after the longest retention. It can't hold a text index, so
+        searches fall back to a message regex.
+    """
+    if settings['mode'] not in STORAGE_MODES:
+        raise ValueError(f"'{settings['mode']}' is not a valid storage mode")
+
+    indexes = [(field, 'id') for field in SORTABLE_FIELDS] + [
+        ('template', '-date_and_time'),
+        ('params.user_id', '-date_and_time'),
+        ('params.endpoint', '-date_and_time'),
+    ]
+    meta = {'indexes': indexes, 'db_alias': Config.LOGGER_CONNECTION_SETTINGS['alias']}
+
+    if settings['mode'] == 'default':
+        indexes.append({'fields': ['expire_at'], 'expireAfterSeconds': 0})
+
+    if settings['mode'] != 'timeseries':
+        indexes.append({
+            'fields': ['$message', '$search_terms'],
+            'default_language': 'none',
+            'weights': {'message': 1, 'search_terms': 10}
+        })
+
+    if settings['mode'] == 'capped':
+        meta['max_size'] = settings['max_size']
+        meta['max_documents'] = settings['max_documents']
+
+    return meta
 
 
 class LoggerModel(Document):
+    SORTABLE_FIELDS = SORTABLE_FIELDS
+    RELEVANCE = 'relevance'
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+
     log_file = StringField()
     info_type = StringField(choices=['INFO', 'ERROR', 'WARNING', 'CRITICAL'])
-    message = StringField(max_length=512)
+    message = StringField()
     date_and_time = DateTimeField()
+    search_terms = ListField(StringField())
+    template = StringField()
+    params = DictField()
+    expire_at = DateTimeField()
+
+    meta = get_storage_meta(Config.LOGGER_STORAGE_SETTINGS)
+
+    # Used instead of the text index when the database can't run $text queries
+    _search_index = InvertedIndex()
+
+    @classmethod
+    def _get_collection(cls):
+        if cls._collection is None and Config.LOGGER_STORAGE_SETTINGS['mode'] == 'timeseries':
+            cls.__create_timeseries_collection()
+
+        return super()._get_collection()
+
+    @classmethod
+    def __create_timeseries_collection(cls) -> None:
+        db = cls._get_db()
+        collection_name = cls._get_collection_name()
+
+        if collection_name in db.list_collection_names():
+            return
+
+        retention_days = Config.LOGGER_STORAGE_SETTINGS['retention_days'].values()
+        db.create_collection(
+            collection_name,
+            timeseries={'timeField': 'date_and_time', 'metaField': 'info_type', 'granularity': 'seconds'},
+            expireAfterSeconds=int(timedelta(days=max(retention_days)).total_seconds())
+        )
+
+    @classmethod
+    def get_expire_at(cls, info_type: str, date_and_time: Optional[datetime]) -> Optional[datetime]:
+        """
+        Returns the time a log of the given level expires at, None to keep it forever
+        """
+        settings = Config.LOGGER_STORAGE_SETTINGS
+        retention_days = settings['retention_days'].get(info_type)
+
+        if settings['mode'] != 'default' or not retention_days:
+            return None
+
+        return (date_and_time or utcnow()) + timedelta(days=retention_days)
+
+    @classmethod
+    def __prepare(cls, log: 'LoggerModel') -> 'LoggerModel':
+        log.search_terms = log.search_terms or extract_search_terms(log.message, log.params)
+        log.expire_at = log.expire_at or cls.get_expire_at(log.info_type, log.date_and_time)
+
+        return log
 
     @classmethod
     def create_log(cls, **kwargs):
-        log = cls(**kwargs)
-        log.save()
+        log = cls.__prepare(cls(**kwargs))
+        cls.__insert([log])
 
         return log
 
+    @classmethod
+    def create_logs(cls, logs: list[dict]) -> list:
+        """
+        Writes a batch of logs with a single insert_many round trip
+        """
+        if not logs:
+            return []
+
+        documents = [cls.__prepare(cls(**fields)) for fields in logs]
+        cls.__insert(documents)
+
+        return [document.id for document in documents]
+
+    @classmethod
+    def __insert(cls, documents: list['LoggerModel']) -> None:
+        """
+        Inserts the logs unordered, one insert_many per level with the write
+        concern of Config.LOGGER_CONNECTION_SETTINGS for that level, and skips
+        the ones whose id is already stored, so a log written again (replayed
+        from the spool, retried) is stored, indexed and counted in the rollups
+        only once. Time series collections have no unique _id, they may keep
+        both copies, and unacknowledged writes report no duplicates at all
+        """
+        for document in documents:
+            document.validate()
+
+        raw_documents = [document.to_mongo() for document in documents]
+        indexes_by_write_concern = {}
+        for index, document in enumerate(documents):
+            indexes_by_write_concern.setdefault(get_write_concern(document.info_type), []).append(index)
+
+        duplicates = set()
+        for write_concern, indexes in indexes_by_write_concern.items():
+            collection = cls._get_collection().with_options(write_concern=WriteConcern(w=write_concern))
+
+            try:
+                collection.insert_many([raw_documents[index] for index in indexes], ordered=False)
+            except BulkWriteError as error:
+                write_errors = error.details['writeErrors']
+                if any(write_error['code'] != 11000 for write_error in write_errors):
+                    raise
+
+                duplicates.update(indexes[write_error['index']] for write_error in write_errors)
+
+        for document, raw_document in zip(documents, raw_documents):
+            document.id = raw_document['_id']
+
+        inserted = [document for index, document in enumerate(documents) if index not in duplicates]
+
+        cls.__add_to_search_index(inserted)
+        LogRollup.add_logs(inserted)
+
+    @classmethod
+    def drop_collection(cls):
+        super().drop_collection()
+        cls._search_index.clear()
+
+    @classmethod
+    def get_logs_page(
+            cls,
+            sort_by: str = 'date_and_time',
+            order: str = 'desc',
+            search: str = '',
+            cursor: Optional[str] = None,
+            page_size: int = DEFAULT_PAGE_SIZE
+    ) -> tuple[list['LoggerModel'], Optional[str]]:
+        """
+        Returns one page of logs ordered by (sort_by, id) and the cursor of the next page.
+        The cursor holds the sort key of the last returned log, so every page
+        is a bounded index range scan no matter how deep it is.
+
+        With a search query the logs are matched through the text index, and
+        sort_by='relevance' ranks them by text score instead (time series
+        collections can't rank, they fall back to date_and_time).
+        """
+        page_size = max(1, min(page_size, cls.MAX_PAGE_SIZE))
+        search_backend = cls.__get_search_backend() if search else None
+
+        if sort_by == cls.RELEVANCE and search:
+            if search_backend != 'regex':
+                return cls.__get_relevance_page(search, cursor, page_size)
+
+            sort_by = 'date_and_time'
+
+        if sort_by not in cls.SORTABLE_FIELDS:
+            raise ValidationError(f"'{sort_by}' is not a sortable field")
+
+        direction = '' if order == 'asc' else '-'
+        query = Q()
+
+        if search_backend == 'index':
+            query &= Q(id__in=cls.__search_ids(search))
+        elif search_backend == 'regex':
+            query &= Q(message__icontains=search)
+
+        if cursor:
+            value, last_id = cls.__decode_cursor(sort_by, cursor)
+            operator = 'gt' if order == 'asc' else 'lt'
+            query &= Q(**{f'{sort_by}__{operator}': value}) | Q(**{sort_by: value, f'id__{operator}': last_id})
+
+        queryset = cls.objects(query)
+        if search_backend == 'text':
+            queryset = queryset.search_text(search)
+
+        logs = list(queryset.order_by(f'{direction}{sort_by}', f'{direction}id').limit(page_size + 1))
+
+        if len(logs) <= page_size:
+            return logs, None
+
+        logs = logs[:page_size]
+
+        return logs, cls.__encode_cursor(sort_by, logs[-1])
+
+    @classmethod
+    def __get_relevance_page(
+            cls,
+            search: str,
+            cursor: Optional[str],
+            page_size: int
+    ) -> tuple[list['LoggerModel'], Optional[str]]:
+        """
+        Relevance pages continue from an offset into the matches, so their cost
+        depends on the number of matching logs only
+        """
+        offset = cls.__decode_cursor(cls.RELEVANCE, cursor) if cursor else 0
+
+        if cls.__get_search_backend() == 'text':
+            logs = list(cls.objects.search_text(search).order_by('$text_score').skip(offset).limit(page_size + 1))
+        else:
+            page_ids = cls.__search_ids(search)[offset:offset + page_size + 1]
+            logs_by_id = {log.id: log for log in cls.objects(id__in=page_ids)}
+            logs = [logs_by_id[log_id] for log_id in page_ids if log_id in logs_by_id]
+
+        if len(logs) <= page_size:
+            return logs, None
+
+        return logs[:page_size], cls.__encode_cursor(cls.RELEVANCE, offset + page_size)
+
+    @classmethod
+    def __get_search_backend(cls) -> str:
+        if isinstance(cls._get_db().client, MockMongoClient):
+            return 'index'
+
+        if Config.LOGGER_STORAGE_SETTINGS['mode'] == 'timeseries':
+            return 'regex'
+
+        return 'text'
+
+    @classmethod
+    def __search_ids(cls, search: str) -> list:
+        if not cls._search_index.is_built:
+            cls._search_index.clear()
+            for log in cls.objects.only('message', 'search_terms'):
+                cls._search_index.add(log.id, log.message, log.search_terms)
+            cls._search_index.is_built = True
+
+        return cls._search_index.search(search)
+
+    @classmethod
+    def __add_to_search_index(cls, logs: list['LoggerModel']) -> None:
+        if not cls._search_index.is_built:
+            return
+
+        for log in logs:
+            cls._search_index.add(log.id, log.message, log.search_terms)
+
+    @staticmethod
+    def __encode_cursor(sort_by: str, log_or_offset) -> str:
+        if sort_by == LoggerModel.RELEVANCE:
+            key = [log_or_offset]
+        else:
+            value = log_or_offset[sort_by]
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            key = [value, str(log_or_offset.id)]
+
+        return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def __decode_cursor(sort_by: str, cursor: str):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if sort_by == LoggerModel.RELEVANCE:
+                (offset,) = key
+                return max(0, int(offset))
+
+            value, last_id = key
+            if sort_by == 'date_and_time':
+                value = datetime.fromisoformat(value)
+
+            return value, ObjectId(last_id)
+        except (ValueError, TypeError, InvalidId):
+            raise ValidationError('Invalid page cursor')
+
     @override
     def to_json(self, *args, **kwargs):
         return {
@@ -23,5 +344,212 @@ class LoggerModel(Document):
             'log_file': self.log_file,
             'log_type': self.info_type,
             'message': self.message,
-            'data_and_time': self.date_and_time
+            'data_and_time': self.date_and_time,
+            'template': self.template,
+            'params': self.params
+        }
+
+
+class LogRollup(Document):
+    """
+        description:
+            Pre-aggregated log counts. Every written log increments one
+            per-minute and one per-hour document keyed by its level, endpoint,
+            method and user, so analytics read a few small documents instead
+            of aggregating over logger_model. Endpoints are stored with ids
+            replaced by '<id>' to keep the number of rollups bounded.
+
+            The increments are summed in memory and written by a background
+            thread every flush_interval seconds of Config.LOGGER_ROLLUP_SETTINGS,
+            with the write concern of their level, so writing a log costs no
+            extra round trip. The increments of the last interval are lost
+            if the process dies.
+
+        methods:
+            add_logs: adds the increments of a batch of logs to the pending ones.
+
+            flush: writes the pending increments with one bulk write per
+            write concern.
+
+            get_counts: returns the counts within [date_from, date_to) grouped
+            by any of GROUP_BY_FIELDS.
+    """
+    GRANULARITIES = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1)}
+    RETENTION = {'minute': timedelta(days=2), 'hour': timedelta(days=90)}
+    GROUP_BY_FIELDS = ('bucket', 'level', 'endpoint', 'method', 'user')
+    ID_PATTERN = re.compile(r'/[0-9a-f]{24}(?=/|$)')
+
+    granularity = StringField(required=True, choices=list(GRANULARITIES))
+    bucket = DateTimeField(required=True)
+    level = StringField()
+    endpoint = StringField()
+    method = StringField()
+    user = StringField()
+    count = IntField(default=0)
+    expire_at = DateTimeField()
+
+    meta = {
+        'db_alias': Config.LOGGER_CONNECTION_SETTINGS['alias'],
+        'indexes': [
+            {'fields': ['granularity', 'bucket', 'level', 'endpoint', 'method', 'user'], 'unique': True},
+            {'fields': ['expire_at'], 'expireAfterSeconds': 0}
+        ]
+    }
+
+    _pending = Counter()
+    _pending_lock = threading.Lock()
+    # serializes the writes with drop_collection, so no flush outlives the collection it read
+    _flush_lock = threading.Lock()
+    _flusher_pid: Optional[int] = None
+
+    @classmethod
+    def get_bucket(cls, granularity: str, date_and_time: datetime) -> datetime:
+        bucket = date_and_time.replace(second=0, microsecond=0)
+
+        return bucket.replace(minute=0) if granularity == 'hour' else bucket
+
+    @classmethod
+    def normalize_endpoint(cls, endpoint: Optional[str]) -> Optional[str]:
+        return cls.ID_PATTERN.sub('/<id>', endpoint) if endpoint else endpoint
+
+    @classmethod
+    def add_logs(cls, logs: Iterable[LoggerModel]) -> None:
+        increments = Counter()
+
+        for log in logs:
+            params = log.params or {}
+            date_and_time = log.date_and_time or utcnow()
+
+            # a sampling summary stands for the records it suppressed
+            count = params.get('suppressed', 1) if log.template == SUPPRESSED_TEMPLATE else 1
+
+            for granularity in cls.GRANULARITIES:
+                increments[(
+                    granularity,
+                    cls.get_bucket(granularity, date_and_time),
+                    log.info_type,
+                    cls.normalize_endpoint(params.get('endpoint')),
+                    params.get('method'),
+                    params.get('email')
+                )] += count
+
+        if not increments:
+            return
+
+        with cls._pending_lock:
+            cls._pending.update(increments)
+
+            # the thread does not survive a fork, each worker process starts its own
+            if cls._flusher_pid != os.getpid():
+                cls._flusher_pid = os.getpid()
+                threading.Thread(target=cls.__run_flusher, name='LogRollupFlusher', daemon=True).start()
+
+    @classmethod
+    def flush(cls) -> None:
+        with cls._flush_lock:
+            with cls._pending_lock:
+                increments, cls._pending = cls._pending, Counter()
+
+            if not increments:
+                return
+
+            increments_by_write_concern = {}
+            for key, count in increments.items():
+                increments_by_write_concern.setdefault(get_write_concern(key[2]), {})[key] = count
+
+            for write_concern, pending in list(increments_by_write_concern.items()):
+                try:
+                    cls.__write(write_concern, pending)
+                except Exception:
+                    # the increments that were not written are retried with the next flush
+                    with cls._pending_lock:
+                        for unwritten in increments_by_write_concern.values():
+                            cls._pending.update(unwritten)
+                    raise
+
+                del increments_by_write_concern[write_concern]
+
+    @classmethod
+    def get_counts(
+            cls,
+            granularity: str,
+            date_from: datetime,
+            date_to: datetime,
+            group_by: Iterable[str] = ('bucket',),
+            **filters
+    ) -> list[dict]:
+        if granularity not in cls.GRANULARITIES:
+            raise ValidationError(f"'{granularity}' is not a valid granularity")
+
+        group_by = list(group_by)
+        for field in group_by + list(filters):
+            if field not in cls.GROUP_BY_FIELDS:
+                raise ValidationError(f"'{field}' is not a valid analytics field")
+
+        match = {
+            'granularity': granularity,
+            'bucket': {'$gte': cls.get_bucket(granularity, date_from), '$lt': date_to},
+            **filters
         }
+
+        # the counts of this process are read with the others
+        cls.flush()
+
+        pipeline = [
+            {'$match': match},
+            {'$group': {'_id': {field: f'${field}' for field in group_by}, 'count': {'$sum': '$count'}}},
+            {'$sort': {**{f'_id.{field}': 1 for field in group_by}, 'count': -1}}
+        ]
+
+        return [{**row['_id'], 'count': row['count']} for row in cls._get_collection().aggregate(pipeline)]
+
+    @classmethod
+    def drop_collection(cls):
+        with cls._flush_lock:
+            with cls._pending_lock:
+                cls._pending.clear()
+
+            super().drop_collection()
+
+    @classmethod
+    def __run_flusher(cls) -> None:
+        while True:
+            time.sleep(Config.LOGGER_ROLLUP_SETTINGS['flush_interval'])
+
+            try:
+                cls.flush()
+            except Exception:
+                # the database is unavailable, the increments stay pending
+                continue
+
+    @classmethod
+    def __write(cls, write_concern, increments: dict) -> None:
+        collection = cls._get_collection().with_options(write_concern=WriteConcern(w=write_concern))
+        collection.bulk_write([
+            UpdateOne(
+                {
+                    'granularity': granularity,
+                    'bucket': bucket,
+                    'level': level,
+                    'endpoint': endpoint,
+                    'method': method,
+                    'user': user
+                },
+                {
+                    '$inc': {'count': count},
+                    '$setOnInsert': {'expire_at': bucket + cls.RETENTION[granularity]}
+                },
+                upsert=True
+            )
+            for (granularity, bucket, level, endpoint, method, user), count in increments.items()
+        ], ordered=False)
+
+
+def flush_rollups_at_exit() -> None:
+    try:
+        LogRollup.flush()
+    except Exception:
+        pass
+
+
+atexit.register(flush_rollups_at_exit)
@@ -0,0 +1,249 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging.handlers import BaseRotatingHandler
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+
+INDEX_SUFFIX = '.index'
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def read_segment_index(filename: str) -> list[dict]:
+    """
+    Returns the index entries of the rotated segments of a log file, oldest first.
+    Every entry holds the segment file name, the timestamps of its first and
+    last records, the number of records and whether it is compressed yet.
+    """
+    try:
+        with open(filename + INDEX_SUFFIX, encoding='utf-8') as index_file:
+            return json.load(index_file)
+    except FileNotFoundError:
+        return []
+
+
+def find_segments(filename: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> list[str]:
+    """
+    Returns the paths of the rotated segments that may hold records
+    logged within [start, end), so only they have to be read
+    """
+    directory = os.path.dirname(filename)
+    start_timestamp = start.timestamp() if start else float('-inf')
+    end_timestamp = end.timestamp() if end else float('inf')
+
+    return [
+        os.path.join(directory, segment['file'])
+        for segment in read_segment_index(filename)
+        if (segment['first'] is None or segment['first'] < end_timestamp)
+        and (segment['last'] is None or segment['last'] >= start_timestamp)
+    ]
+
+
+class RotatingCompressedFileHandler(BaseRotatingHandler):
+    """
+        description:
+            File handler that rotates the log file once it reaches max_bytes
+            or once interval seconds have passed since the segment was
+            opened. Rotated segments are compressed (gzip or zstd) and pruned
+            by a background worker, so the logging thread only pays for a
+            rename.
+
+            Every rotated segment is recorded in '<filename>.index' with the
+            timestamps of its first and last records, see find_segments.
+
+        retention:
+            backup_count: maximum number of rotated segments to keep.
+
+            max_age: seconds after which a rotated segment is deleted.
+
+            0 disables the corresponding limit.
+    """
+    def __init__(
+            self,
+            filename: str,
+            max_bytes: int = 0,
+            interval: int = 0,
+            backup_count: int = 0,
+            max_age: int = 0,
+            compression: Optional[str] = 'gzip',
+            encoding: str = 'utf-8',
+            delay: bool = False
+    ):
+        if compression not in (None, *COMPRESSION_SUFFIXES):
+            raise ValueError(f"'{compression}' is not a valid compression")
+
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+
+        super().__init__(filename, 'a', encoding=encoding, delay=delay)
+
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.max_age = max_age
+        self.compression = compression
+
+        self._index_lock = threading.Lock()
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='LogCompressor')
+        self._segment_started_at = time.time()
+        self._first_record_at = None
+        self._last_record_at = None
+        self._records = 0
+
+        self.__seed_from_existing_file()
+
+    def shouldRollover(self, record) -> bool:
+        if not self._records:
+            return False
+
+        if self.interval and record.created >= self._segment_started_at + self.interval:
+            return True
+
+        if self.max_bytes:
+            if self.stream is None:
+                self.stream = self._open()
+
+            return self.stream.tell() >= self.max_bytes
+
+        return False
+
+    def emit(self, record):
+        super().emit(record)
+
+        if not self._records:
+            self._first_record_at = record.created
+        self._last_record_at = record.created
+        self._records += 1
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        segment_name = self.__get_segment_name()
+        os.rename(self.baseFilename, os.path.join(os.path.dirname(self.baseFilename), segment_name))
+
+        self.__update_index(lambda index: index + [{
+            'file': segment_name,
+            'first': self._first_record_at,
+            'last': self._last_record_at,
+            'records': self._records,
+            'compressed': False
+        }])
+
+        self._segment_started_at = time.time()
+        self._first_record_at = None
+        self._last_record_at = None
+        self._records = 0
+
+        if not self.delay:
+            self.stream = self._open()
+
+        self._compressor.submit(self.__compress_and_prune, segment_name)
+
+    def close(self):
+        self._compressor.shutdown(wait=True)
+        super().close()
+
+    def __seed_from_existing_file(self) -> None:
+        """
+        A restarted process appends to the segment it left behind. The time of
+        its first record is unknown, so it stays None, which find_segments
+        matches with any range, and the time of its last one is at most the
+        modification time of the file
+        """
+        try:
+            stat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return
+
+        if not stat.st_size:
+            return
+
+        with open(self.baseFilename, 'rb') as log_file:
+            self._records = sum(chunk.count(b'\n') for chunk in iter(lambda: log_file.read(1024 * 1024), b'')) or 1
+
+        self._last_record_at = stat.st_mtime
+
+    def __get_segment_name(self) -> str:
+        started_at = time.strftime(
+            '%Y%m%d-%H%M%S',
+            time.localtime(self._first_record_at or self._segment_started_at)
+        )
+        base_name = f'{os.path.basename(self.baseFilename)}.{started_at}'
+        taken_names = {segment['file'] for segment in read_segment_index(self.baseFilename)}
+
+        directory = os.path.dirname(self.baseFilename)
+
+        segment_name, counter = base_name, 1
+        while segment_name in taken_names or os.path.exists(os.path.join(directory, segment_name)):
+            segment_name, counter = f'{base_name}-{counter}', counter + 1
+
+        return segment_name
+
+    def __update_index(self, update) -> list[dict]:
+        with self._index_lock:
+            index = update(read_segment_index(self.baseFilename))
+
+            temporary_filename = self.baseFilename + INDEX_SUFFIX + '.tmp'
+            with open(temporary_filename, 'w', encoding='utf-8') as index_file:
+                json.dump(index, index_file)
+            os.replace(temporary_filename, self.baseFilename + INDEX_SUFFIX)
+
+            return index
+
+    def __compress_and_prune(self, segment_name: str) -> None:
+        directory = os.path.dirname(self.baseFilename)
+
+        if self.compression:
+            compressed_name = segment_name + COMPRESSION_SUFFIXES[self.compression]
+            self.__compress(os.path.join(directory, segment_name), os.path.join(directory, compressed_name))
+            os.remove(os.path.join(directory, segment_name))
+
+            def mark_compressed(index: list[dict]) -> list[dict]:
+                for segment in index:
+                    if segment['file'] == segment_name:
+                        segment.update(file=compressed_name, compressed=True)
+                return index
+
+            self.__update_index(mark_compressed)
+
+        expired = []
+
+        def prune(index: list[dict]) -> list[dict]:
+            kept = [
+                segment for segment in index
+                if not self.max_age or (segment['last'] or 0) >= time.time() - self.max_age
+            ]
+            if self.backup_count:
+                kept = kept[-self.backup_count:]
+
+            expired.extend(segment['file'] for segment in index if segment not in kept)
+            return kept
+
+        self.__update_index(prune)
+
+        for segment_file in expired:
+            try:
+                os.remove(os.path.join(directory, segment_file))
+            except FileNotFoundError:
+                pass
+
+    def __compress(self, source: str, destination: str) -> None:
+        with open(source, 'rb') as source_file:
+            if self.compression == 'zstd':
+                with open(destination, 'wb') as destination_file:
+                    zstandard.ZstdCompressor().copy_stream(source_file, destination_file)
+            else:
+                with gzip.open(destination, 'wb') as destination_file:
+                    shutil.copyfileobj(source_file, destination_file)
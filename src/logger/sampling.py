@@ -0,0 +1,126 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from typing import Optional, Union
+
+from flask import has_request_context, request
+
+from src.logger.models import LogRollup, SUPPRESSED_TEMPLATE
+
+
+class SamplingFilter(logging.Filter):
+    """
+        description:
+            Logger filter that thins out high-volume template messages before
+            their params are resolved. A record of a template is first kept
+            with the probability ratios[template] (1.0 when not configured),
+            then charged against a token bucket of `rate` records per second
+            and `burst` capacity per (template, endpoint). Records at or above
+            passthrough_level, and records that are not LogMessages, always
+            pass.
+
+            The suppressed records are counted per (template, level, endpoint,
+            method). Every summary_interval seconds a background thread logs
+            one summary record per key with the count, at the level of the
+            suppressed records, so totals (and the log rollups) stay accurate.
+
+        methods:
+            emit_summary: logs the summary of the records suppressed since
+            the previous one.
+
+            close: stops the summary thread after a last summary.
+    """
+    def __init__(
+            self,
+            logger: logging.Logger,
+            ratios: dict[str, float] = None,
+            rate: float = 0,
+            burst: float = 10,
+            passthrough_level: Union[int, str] = logging.ERROR,
+            summary_interval: float = 60
+    ):
+        super().__init__()
+
+        self.logger = logger
+        self.ratios = ratios or {}
+        self.rate = rate
+        self.burst = burst
+        self.passthrough_level = (
+            logging.getLevelName(passthrough_level) if isinstance(passthrough_level, str) else passthrough_level
+        )
+        self.summary_interval = summary_interval
+
+        self._buckets = {}
+        self._suppressed = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._summary_thread = threading.Thread(target=self.__run_summary, name='SamplingSummary', daemon=True)
+        self._summary_thread.start()
+
+    def filter(self, record):
+        template = getattr(record.msg, 'template', None)
+
+        if template is None or template == SUPPRESSED_TEMPLATE or record.levelno >= self.passthrough_level:
+            return True
+
+        ratio = self.ratios.get(template, 1.0)
+        if ratio >= 1 and not self.rate:
+            return True
+
+        endpoint, method = self.__get_endpoint()
+
+        with self._lock:
+            if (ratio >= 1 or random.random() < ratio) and self.__take_token(template, endpoint):
+                return True
+
+            self._suppressed[(template, record.levelno, endpoint, method)] += 1
+
+        return False
+
+    def emit_summary(self) -> None:
+        from src.logger.logger import LogMessage
+
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, Counter()
+
+        for (template, level, endpoint, method), count in suppressed.items():
+            self.logger.log(level, LogMessage(SUPPRESSED_TEMPLATE, {
+                'sampled_template': template,
+                'suppressed': count,
+                'endpoint': endpoint,
+                'method': method
+            }))
+
+    def close(self) -> None:
+        self._stopped.set()
+        self.emit_summary()
+
+    def __take_token(self, template: str, endpoint: str) -> bool:
+        if not self.rate:
+            return True
+
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get((template, endpoint), (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        if tokens < 1:
+            self._buckets[(template, endpoint)] = (tokens, now)
+            return False
+
+        self._buckets[(template, endpoint)] = (tokens - 1, now)
+        return True
+
+    @staticmethod
+    def __get_endpoint() -> tuple[Optional[str], Optional[str]]:
+        # read from the request, not the params, which are not resolved yet
+        if not has_request_context():
+            return None, None
+
+        return LogRollup.normalize_endpoint(request.path), request.method
+
+    def __run_summary(self) -> None:
+        while not self._stopped.wait(self.summary_interval):
+            self.emit_summary()
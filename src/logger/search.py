@@ -0,0 +1,79 @@
+import re
+import threading
+from collections import defaultdict
+from typing import Iterable, Optional
+
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+ENDPOINT_PATTERN = re.compile(r'(?<!\S)/[\w\-/]*')
+TABLE_PATTERN = re.compile(r'\bat (\w+) (?:table|in) ')
+TOKEN_PATTERN = re.compile(r'\w+')
+SEARCH_TERM_PARAMS = ('email', 'endpoint', 'table_name')
+
+
+def extract_search_terms(message: Optional[str], params: Optional[dict] = None) -> list[str]:
+    """
+    Returns the emails, endpoints and table names of a log. Structured logs
+    carry them in their params, plain messages are scanned for them.
+    """
+    if params:
+        terms = [params[param] for param in SEARCH_TERM_PARAMS if params.get(param)]
+    elif message:
+        terms = EMAIL_PATTERN.findall(message) + ENDPOINT_PATTERN.findall(message) + TABLE_PATTERN.findall(message)
+    else:
+        return []
+
+    return list(dict.fromkeys(term.lower() for term in terms))
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class InvertedIndex:
+    """
+        description:
+            In-process replacement for the MongoDB text index, used when the
+            database does not support $text (mongomock in TestConfig).
+            Tokens map to the ids of the logs that contain them, so a search
+            only touches the postings of the query tokens.
+
+        methods:
+            add: indexes a log message and its search terms.
+
+            search: returns the ids of logs matching any query token, the most
+            relevant (then the newest) first. Search terms outweigh plain message words the same
+            way the text index weights do.
+
+            clear: forgets every indexed log.
+    """
+    def __init__(self, message_weight: int = 1, search_terms_weight: int = 10):
+        self.message_weight = message_weight
+        self.search_terms_weight = search_terms_weight
+        self.is_built = False
+
+        self._postings = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def add(self, log_id, message: Optional[str], search_terms: Iterable[str] = ()) -> None:
+        with self._lock:
+            for token in tokenize(message):
+                self._postings[token][log_id] += self.message_weight
+
+            for term in search_terms:
+                for token in tokenize(term):
+                    self._postings[token][log_id] += self.search_terms_weight
+
+    def search(self, query: str) -> list:
+        scores = defaultdict(int)
+
+        with self._lock:
+            for token in set(tokenize(query)):
+                for log_id, weight in self._postings.get(token, {}).items():
+                    scores[log_id] += weight
+
+        return sorted(scores, key=lambda log_id: (scores[log_id], log_id), reverse=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self.is_built = False
@@ -0,0 +1,329 @@
+import fcntl
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Optional
+
+import bson
+import pymongo
+
+# length and crc32 of the record that follows, a zero length marks the end of the written data
+RECORD_HEADER = struct.Struct('>II')
+SEGMENT_PATTERN = re.compile(r'^(\d{12})\.wal$')
+
+
+class SegmentSpool:
+    """
+        description:
+            Append-only write-ahead log of byte records, split into segments
+            of segment_size bytes. The segment being written is memory-mapped,
+            so an append is a memory copy: the kernel writes the pages back
+            even if the process dies, and flush() forces them to disk.
+
+            A reader consumes the records in order from a checkpoint stored
+            next to the segments. commit() advances the checkpoint and deletes
+            the segments that were read completely. Records between the
+            checkpoint and a crash are read again (at-least-once delivery).
+
+        methods:
+            append: writes a record, returns False when the spool is full.
+
+            read: returns up to max_records records after the checkpoint and
+            the position after them.
+
+            commit: moves the checkpoint to a position returned by read.
+
+            is_empty: tells whether every record was committed.
+    """
+    def __init__(self, directory: str, segment_size: int = 16 * 1024 * 1024, max_segments: int = 64):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+
+        self._lock = threading.Lock()
+        self._checkpoint_path = os.path.join(directory, 'checkpoint')
+
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self.__list_segments()
+        self._checkpoint = self.__read_checkpoint(segments)
+        self._segment, self._offset = None, 0
+        self.__open_segment(segments[-1] if segments else self._checkpoint[0])
+
+    def append(self, record: bytes) -> bool:
+        size = RECORD_HEADER.size + len(record)
+        if size + RECORD_HEADER.size > self.segment_size:
+            raise ValueError(f'Record of {len(record)} bytes does not fit in a segment')
+
+        with self._lock:
+            if self._offset + size + RECORD_HEADER.size > self.segment_size:
+                if self._segment_number - self._checkpoint[0] + 1 >= self.max_segments:
+                    return False
+
+                self._map.flush()
+                self._map.close()
+                self.__open_segment(self._segment_number + 1)
+
+            self._map[self._offset:self._offset + size] = RECORD_HEADER.pack(len(record), zlib.crc32(record)) + record
+            self._offset += size
+
+            return True
+
+    def read(self, max_records: int) -> tuple[list[bytes], tuple[int, int]]:
+        records = []
+        segment, offset = self._checkpoint
+
+        with self._lock:
+            end = (self._segment_number, self._offset)
+
+        while (segment, offset) < end:
+            limit = end[1] if segment == end[0] else self.segment_size
+
+            with open(self.__get_path(segment), 'rb') as file:
+                file.seek(offset)
+
+                while offset + RECORD_HEADER.size <= limit and len(records) < max_records:
+                    length, checksum = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+                    record = file.read(length)
+
+                    # a zero length ends a segment, a bad checksum is the torn tail of a crashed writer
+                    if not length or zlib.crc32(record) != checksum:
+                        offset = limit
+                        break
+
+                    records.append(record)
+                    offset += RECORD_HEADER.size + length
+
+            if len(records) == max_records or segment == end[0]:
+                break
+
+            segment, offset = segment + 1, 0
+
+        return records, (segment, offset)
+
+    def commit(self, position: tuple[int, int]) -> None:
+        self._checkpoint = position
+        self.__write_checkpoint(position)
+
+        for segment in self.__list_segments():
+            if segment < position[0]:
+                os.remove(self.__get_path(segment))
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._checkpoint >= (self._segment_number, self._offset)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._map.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._segment.close()
+
+    def __open_segment(self, number: int) -> None:
+        path = self.__get_path(number)
+        is_new = not os.path.exists(path)
+
+        if self._segment is not None:
+            self._segment.close()
+
+        self._segment = open(path, 'w+b' if is_new else 'r+b')
+        if is_new:
+            self._segment.truncate(self.segment_size)
+
+        self._segment_number = number
+        self._map = mmap.mmap(self._segment.fileno(), self.segment_size)
+        self._offset = 0 if is_new else self.__find_end(self._map)
+
+    def __find_end(self, segment_map: mmap.mmap) -> int:
+        offset = 0
+
+        while offset + RECORD_HEADER.size <= self.segment_size:
+            length, checksum = RECORD_HEADER.unpack_from(segment_map, offset)
+            end = offset + RECORD_HEADER.size + length
+
+            if not length or end > self.segment_size or zlib.crc32(segment_map[end - length:end]) != checksum:
+                break
+
+            offset = end
+
+        return offset
+
+    def __get_path(self, number: int) -> str:
+        return os.path.join(self.directory, f'{number:012d}.wal')
+
+    def __list_segments(self) -> list[int]:
+        return sorted(
+            int(match.group(1)) for match in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if match
+        )
+
+    def __read_checkpoint(self, segments: list[int]) -> tuple[int, int]:
+        try:
+            with open(self._checkpoint_path) as file:
+                checkpoint = json.load(file)
+                return checkpoint['segment'], checkpoint['offset']
+        except (OSError, ValueError, KeyError):
+            return (segments[0] if segments else 0), 0
+
+    def __write_checkpoint(self, position: tuple[int, int]) -> None:
+        temporary_path = self._checkpoint_path + '.tmp'
+
+        with open(temporary_path, 'w') as file:
+            json.dump({'segment': position[0], 'offset': position[1]}, file)
+
+        os.replace(temporary_path, self._checkpoint_path)
+
+
+class LogSpool:
+    """
+        description:
+            Keeps database log writes off a slow or unavailable MongoDB.
+            While the database is healthy write() inserts directly, bounded
+            by slow_threshold seconds; a write that fails or takes longer switches
+            the spool to degraded mode, in which logs are appended to a
+            SegmentSpool on disk instead (a memory copy, so request latency
+            stays flat during the incident).
+
+            A replayer thread drains the spool with bulk inserts of
+            replay_batch_size logs every replay_interval seconds, and returns
+            to direct writes once it is empty and the database answers in
+            time. Every log carries the id it was given when it was emitted
+            and LoggerModel.create_logs skips ids that are already stored, so
+            logs replayed twice are stored once.
+
+            The spool of a process lives in the first <directory>/<n>
+            directory it can lock, which is also how the spool of a dead
+            worker is picked up by its replacement.
+
+        methods:
+            write: writes a batch of log fields to the database or the spool.
+
+            close: stops the replayer and closes the spool.
+    """
+    def __init__(
+            self,
+            directory: str,
+            segment_size: int = 16 * 1024 * 1024,
+            max_segments: int = 64,
+            slow_threshold: float = 0.5,
+            replay_batch_size: int = 500,
+            replay_interval: float = 1.0,
+            write_logs: Optional[Callable[[list[dict]], object]] = None
+    ):
+        self.slow_threshold = slow_threshold
+        self.replay_batch_size = replay_batch_size
+        self.replay_interval = replay_interval
+        self.degraded = False
+        self.dropped = 0
+
+        self._write_logs = write_logs
+        self._lock_file = self.__lock_directory(directory)
+        self._spool = SegmentSpool(os.path.dirname(self._lock_file.name), segment_size, max_segments)
+        self._stopped = threading.Event()
+
+        # taken to append and to leave degraded mode, so no record is appended
+        # between the replayer seeing an empty spool and switching to direct writes
+        self._mode_lock = threading.Lock()
+
+        # records left by a previous process are replayed first
+        self.degraded = not self._spool.is_empty()
+
+        self._replayer = threading.Thread(target=self.__run_replayer, name='LogSpoolReplayer', daemon=True)
+        self._replayer.start()
+
+    def write(self, logs: list[dict]) -> None:
+        with self._mode_lock:
+            if self.degraded:
+                self.__append(logs)
+                return
+
+        started_at = time.monotonic()
+        try:
+            # a stopped or stalled database fails the write after slow_threshold instead of blocking the caller
+            with pymongo.timeout(self.slow_threshold):
+                self.__write_logs(logs)
+        except Exception:
+            with self._mode_lock:
+                self.degraded = True
+                self.__append(logs)
+            return
+
+        if time.monotonic() - started_at > self.slow_threshold:
+            self.degraded = True
+
+    def replay(self) -> int:
+        """
+        Writes one batch of spooled logs to the database and returns
+        how many were written. Leaves degraded mode once the spool
+        is empty and the write was fast enough
+        """
+        records, position = self._spool.read(self.replay_batch_size)
+
+        started_at = time.monotonic()
+        if records:
+            self.__write_logs([bson.decode(record) for record in records])
+        self._spool.commit(position)
+
+        if time.monotonic() - started_at <= self.slow_threshold:
+            with self._mode_lock:
+                if self._spool.is_empty():
+                    self.degraded = False
+
+        return len(records)
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._replayer.join()
+        self._spool.close()
+        self._lock_file.close()
+
+    def __write_logs(self, logs: list[dict]) -> None:
+        if self._write_logs is None:
+            from src.logger.models import LoggerModel
+
+            self._write_logs = LoggerModel.create_logs
+
+        self._write_logs(logs)
+
+    def __append(self, logs: list[dict]) -> None:
+        for fields in logs:
+            if not self._spool.append(bson.encode(fields)):
+                self.dropped += 1
+
+    def __run_replayer(self) -> None:
+        while not self._stopped.wait(self.replay_interval):
+            if not self.degraded and self._spool.is_empty():
+                continue
+
+            self._spool.flush()
+
+            try:
+                while self.replay() == self.replay_batch_size and not self._stopped.is_set():
+                    pass
+            except Exception:
+                # the database is still unavailable, the records stay in the spool
+                continue
+
+    @staticmethod
+    def __lock_directory(directory: str):
+        number = 0
+
+        while True:
+            path = os.path.join(directory, str(number))
+            os.makedirs(path, exist_ok=True)
+
+            lock_file = open(os.path.join(path, 'lock'), 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                lock_file.close()
+                number += 1
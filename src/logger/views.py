@@ -1,19 +1,148 @@
-from flask import request, render_template
+import logging
+from datetime import datetime, timedelta
+
+from flask import request, render_template, Response, stream_with_context
+from mongoengine import ValidationError
 
 from src import app
-from src.logger.models import LoggerModel
+from src.base_classes import utcnow
+from src.config import Config
+from src.logger.broadcast import LogBroadcaster, TooManySubscribers
+from src.logger.export import export_logs, EXPORT_FORMATS, MIMETYPES, parse_levels
+from src.logger.logger import LoggerFactory
+from src.logger.models import LoggerModel, LogRollup
 
 
 @app.route('/', methods=['GET'])
 def logs():
-    sort_by = request.args.get('sort_by', 'date_and_time')
-    order = request.args.get('order', 'desc')
     search = request.args.get('search', '')
+    sort_by = request.args.get('sort_by', LoggerModel.RELEVANCE if search else 'date_and_time')
+    order = request.args.get('order', 'desc')
+    cursor = request.args.get('cursor')
+    page_size = request.args.get('page_size', LoggerModel.DEFAULT_PAGE_SIZE, type=int)
+
+    if sort_by not in LoggerModel.SORTABLE_FIELDS and not (search and sort_by == LoggerModel.RELEVANCE):
+        sort_by = 'date_and_time'
+
+    try:
+        logs, next_cursor = LoggerModel.get_logs_page(sort_by, order, search, cursor, page_size)
+    except ValidationError as exception:
+        return {'error': exception.message}, 400
+
+    return render_template(
+        'index.html',
+        logs=logs,
+        sort_by=sort_by,
+        order=order,
+        search=search,
+        page_size=page_size,
+        next_cursor=next_cursor
+    )
+
+
+@app.route('/logs/analytics', methods=['GET'])
+def logs_analytics():
+    granularity = request.args.get('granularity', 'minute')
+    group_by = [field for field in request.args.get('group_by', 'bucket').split(',') if field]
+    filters = {field: request.args[field] for field in LogRollup.GROUP_BY_FIELDS[1:] if field in request.args}
+
+    if 'endpoint' in filters:
+        filters['endpoint'] = LogRollup.normalize_endpoint(filters['endpoint'])
+
+    try:
+        date_to = datetime.fromisoformat(request.args['to']) if 'to' in request.args else utcnow()
+        date_from = (
+            datetime.fromisoformat(request.args['from']) if 'from' in request.args
+            else date_to - timedelta(hours=1 if granularity == 'minute' else 24)
+        )
+
+        counts = LogRollup.get_counts(granularity, date_from, date_to, group_by, **filters)
+    except ValueError:
+        return {'error': "'from' and 'to' must be ISO 8601 dates"}, 400
+    except ValidationError as exception:
+        return {'error': exception.message}, 400
+
+    for row in counts:
+        if 'bucket' in row:
+            row['bucket'] = row['bucket'].isoformat()
+
+    return {
+        'granularity': granularity,
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'group_by': group_by,
+        'filters': filters,
+        'total': sum(row['count'] for row in counts),
+        'results': counts
+    }, 200
+
+
+@app.route('/logs/export', methods=['GET'])
+def logs_export():
+    export_format = request.args.get('format', 'ndjson')
+    compress = request.args.get('gzip', 'true').lower() == 'true'
+
+    if export_format not in EXPORT_FORMATS:
+        return {'error': f"'format' must be one of {', '.join(EXPORT_FORMATS)}"}, 400
+
+    try:
+        date_from = datetime.fromisoformat(request.args['from'])
+        date_to = datetime.fromisoformat(request.args['to'])
+    except KeyError:
+        return {'error': "'from' and 'to' are required"}, 400
+    except ValueError:
+        return {'error': "'from' and 'to' must be ISO 8601 dates"}, 400
+
+    try:
+        levels = parse_levels(request.args.get('level'))
+    except ValueError as exception:
+        return {'error': str(exception)}, 400
+
+    filename = f'logs-{date_from:%Y%m%dT%H%M%S}-{date_to:%Y%m%dT%H%M%S}.{export_format}' + ('.gz' if compress else '')
+
+    return Response(
+        export_logs(date_from, date_to, levels, export_format, compress),
+        mimetype='application/gzip' if compress else MIMETYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@app.route('/logs/stream', methods=['GET'])
+def logs_stream():
+    broadcaster = LoggerFactory.get_broadcaster()
+    if broadcaster is None:
+        return {'error': 'Log streaming is disabled'}, 404
+
+    level = request.args.get('level', 'NOTSET').upper()
+    if not isinstance(logging.getLevelName(level), int):
+        return {'error': f"'{level}' is not a valid level"}, 400
+
+    try:
+        subscription = broadcaster.subscribe(
+            logging.getLevelName(level), request.args.get('endpoint'), request.args.get('search', '')
+        )
+    except TooManySubscribers as exception:
+        return {'error': str(exception)}, 503, {'Retry-After': '5'}
+
+    heartbeat_interval = Config.LOGGER_STREAM_SETTINGS['heartbeat_interval']
+
+    def generate():
+        try:
+            # sent right away, so the client knows it is subscribed
+            yield 'retry: 3000\n\n'
+
+            while not subscription.dropped:
+                event = subscription.get(heartbeat_interval)
+
+                # a comment keeps proxies from closing an idle connection
+                yield LogBroadcaster.format_event(event) if event else ': heartbeat\n\n'
 
-    if order == 'asc':
-        order_by = sort_by
-    else:
-        order_by = f'-{sort_by}'
+            yield 'event: dropped\ndata: {"error": "The client fell too far behind"}\n\n'
+        finally:
+            subscription.close()
 
-    logs = LoggerModel.objects(message__icontains=search).order_by(order_by)
-    return render_template('index.html', logs=logs, sort_by=sort_by, order=order, search=search)
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,419 @@
+import bisect
+import logging
+import threading
+import time
+import weakref
+from functools import wraps
+from typing import Iterable, Optional
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ShardedValues:
+    """
+        description:
+            Fixed-size array of floats split into one shard per thread.
+            A thread only ever writes its own shard, so updates take no lock;
+            readers sum the shards. The lock is only taken when a thread
+            writes for the first time and when a thread exits, at which point
+            its shard is folded into the retired totals.
+
+        methods:
+            shard: returns the shard of the calling thread.
+
+            sum: returns the element-wise sum of all shards.
+    """
+    def __init__(self, size: int):
+        self.size = size
+
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = [0.0] * size
+        self._lock = threading.Lock()
+
+    def shard(self) -> list[float]:
+        try:
+            return self._local.holder.shard
+        except AttributeError:
+            return self.__create_shard()
+
+    def sum(self) -> list[float]:
+        with self._lock:
+            return [sum(values) for values in zip(self._retired, *self._shards.values())]
+
+    def __create_shard(self) -> list[float]:
+        holder = _ShardHolder([0.0] * self.size)
+
+        with self._lock:
+            self._shards[id(holder.shard)] = holder.shard
+
+        # the holder dies with the thread-local storage of its thread
+        weakref.finalize(holder, self.__retire, holder.shard)
+        self._local.holder = holder
+
+        return holder.shard
+
+    def __retire(self, shard: list[float]) -> None:
+        with self._lock:
+            del self._shards[id(shard)]
+            self._retired = [retired + value for retired, value in zip(self._retired, shard)]
+
+
+class _ShardHolder:
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard: list[float]):
+        self.shard = shard
+
+
+class Metric:
+    """
+        description:
+            Base class of the metrics. A metric with label names holds one
+            child per combination of label values, created on first use.
+
+        methods:
+            labels: returns the child for the label values. Metrics without
+            labels have a single child, also reachable through the methods
+            of the metric itself (inc, observe).
+
+            render: returns the metric in Prometheus text format.
+    """
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values) -> 'Metric':
+        label_values = tuple(str(value) for value in label_values)
+        child = self._children.get(label_values)
+
+        if child is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f'{self.name} expects the labels {self.label_names}')
+
+            with self._lock:
+                child = self._children.setdefault(label_values, self._create_child())
+
+        return child
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}']
+
+        for label_values, child in list(self._children.items()):
+            lines.extend(self._render_child(dict(zip(self.label_names, label_values)), child))
+
+        return '\n'.join(lines)
+
+    def _create_child(self):
+        raise NotImplementedError
+
+    def _render_child(self, labels: dict, child) -> list[str]:
+        raise NotImplementedError
+
+    @staticmethod
+    def _format_labels(labels: dict) -> str:
+        if not labels:
+            return ''
+
+        escaped = (
+            f'{name}="{value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')}"'
+            for name, value in labels.items()
+        )
+
+        return '{' + ','.join(escaped) + '}'
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    class Child:
+        def __init__(self):
+            self._values = ShardedValues(1)
+
+        def inc(self, amount: float = 1) -> None:
+            self._values.shard()[0] += amount
+
+        @property
+        def value(self) -> float:
+            return self._values.sum()[0]
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _create_child(self) -> Child:
+        return Counter.Child()
+
+    def _render_child(self, labels: dict, child: Child) -> list[str]:
+        return [f'{self.name}{self._format_labels(labels)} {child.value}']
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    class Child:
+        def __init__(self, buckets: tuple[float, ...]):
+            self.buckets = buckets
+
+            # a count per bucket, the count above the last bucket and the sum
+            self._values = ShardedValues(len(buckets) + 2)
+
+        def observe(self, value: float) -> None:
+            shard = self._values.shard()
+            shard[bisect.bisect_left(self.buckets, value)] += 1
+            shard[-1] += value
+
+        def snapshot(self) -> tuple[list[float], float]:
+            values = self._values.sum()
+
+            return values[:-1], values[-1]
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Iterable[str] = (),
+            buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, label_names)
+
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _create_child(self) -> Child:
+        return Histogram.Child(self.buckets)
+
+    def _render_child(self, labels: dict, child: Child) -> list[str]:
+        counts, total = child.snapshot()
+        lines = []
+
+        cumulative_count = 0
+        for bound, count in zip([*self.buckets, '+Inf'], counts):
+            cumulative_count += count
+            bucket_labels = self._format_labels({**labels, 'le': str(bound)})
+            lines.append(f'{self.name}_bucket{bucket_labels} {cumulative_count}')
+
+        lines.append(f'{self.name}_sum{self._format_labels(labels)} {total}')
+        lines.append(f'{self.name}_count{self._format_labels(labels)} {cumulative_count}')
+
+        return lines
+
+
+class MetricsRegistry:
+    """
+        description:
+            Collection of the metrics of the process.
+
+        methods:
+            counter, histogram: create and register a metric.
+
+            render: returns all metrics in Prometheus text format.
+    """
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def counter(self, name: str, documentation: str, label_names: Iterable[str] = ()) -> Counter:
+        return self.__register(Counter(name, documentation, label_names))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Iterable[str] = (),
+            buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.__register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    def __register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+
+        self._metrics[metric.name] = metric
+
+        return metric
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds',
+    'Time until the response of a request is returned',
+    ('endpoint', 'method', 'status')
+)
+HTTP_REQUEST_MONGODB_COMMANDS = REGISTRY.histogram(
+    'http_request_mongodb_commands',
+    'MongoDB commands run by a request',
+    ('endpoint', 'method'),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+HTTP_REQUEST_MONGODB_DURATION = REGISTRY.histogram(
+    'http_request_mongodb_duration_seconds',
+    'Time a request spent in MongoDB commands',
+    ('endpoint', 'method')
+)
+MONGODB_COMMANDS = REGISTRY.counter(
+    'mongodb_commands_total',
+    'MongoDB commands by name and outcome',
+    ('command', 'status')
+)
+MONGODB_COMMAND_DURATION = REGISTRY.counter(
+    'mongodb_command_duration_seconds_total',
+    'Time spent in MongoDB commands by name',
+    ('command',)
+)
+MONGODB_POOL_WAIT_DURATION = REGISTRY.histogram(
+    'mongodb_pool_wait_duration_seconds',
+    'Time a thread waited to check a connection out of the pool of a connection alias',
+    ('pool',)
+)
+MONGODB_POOL_CHECKOUTS = REGISTRY.counter(
+    'mongodb_pool_checkouts_total',
+    'Connection checkouts from the pool of a connection alias by outcome',
+    ('pool', 'status')
+)
+LOG_HANDLER_EMIT_DURATION = REGISTRY.histogram(
+    'log_handler_emit_duration_seconds',
+    'Time a log handler spent emitting a record on the logging thread',
+    ('handler',)
+)
+LOG_DATABASE_BATCH_DURATION = REGISTRY.histogram(
+    'log_database_batch_duration_seconds',
+    'Time the asynchronous database handler spent writing a batch of logs'
+)
+PASSWORD_HASHING_DURATION = REGISTRY.histogram(
+    'password_hashing_duration_seconds',
+    'Time a password hash or check took, including the wait for a worker',
+    ('operation',)
+)
+
+
+class RequestStats(threading.local):
+    """
+    MongoDB usage of the request handled by the current thread
+    """
+    started_at: Optional[float] = None
+    mongodb_commands: int = 0
+    mongodb_duration: float = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self.mongodb_commands = 0
+        self.mongodb_duration = 0.0
+
+    def finish(self, endpoint: str, method: str, status: int) -> None:
+        if self.started_at is None:
+            return
+
+        HTTP_REQUEST_DURATION.labels(endpoint, method, status).observe(time.perf_counter() - self.started_at)
+        HTTP_REQUEST_MONGODB_COMMANDS.labels(endpoint, method).observe(self.mongodb_commands)
+        HTTP_REQUEST_MONGODB_DURATION.labels(endpoint, method).observe(self.mongodb_duration)
+
+        self.started_at = None
+
+
+request_stats = RequestStats()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Counts and times every MongoDB command, and attributes it to the
+    request of the thread that ran it (pymongo reports synchronous
+    commands on the calling thread)
+    """
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.__record(event, 'succeeded')
+
+    def failed(self, event):
+        self.__record(event, 'failed')
+
+    @staticmethod
+    def __record(event, status: str) -> None:
+        duration = event.duration_micros / 1e6
+
+        MONGODB_COMMANDS.labels(event.command_name, status).inc()
+        MONGODB_COMMAND_DURATION.labels(event.command_name).inc(duration)
+
+        if request_stats.started_at is not None:
+            request_stats.mongodb_commands += 1
+            request_stats.mongodb_duration += duration
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """
+    Times the connection checkouts of the client it is passed to, labelled
+    with the alias of its connection. A growing wait or failed checkouts
+    (status 'timeout' once waitQueueTimeoutMS passes) mean the pool is too
+    small for its load
+    """
+    def __init__(self, pool: str):
+        self.pool = pool
+
+    def connection_checked_out(self, event):
+        MONGODB_POOL_WAIT_DURATION.labels(self.pool).observe(event.duration)
+        MONGODB_POOL_CHECKOUTS.labels(self.pool, 'succeeded').inc()
+
+    def connection_check_out_failed(self, event):
+        MONGODB_POOL_WAIT_DURATION.labels(self.pool).observe(event.duration)
+        MONGODB_POOL_CHECKOUTS.labels(self.pool, event.reason).inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+def instrument_handler(handler: logging.Handler) -> logging.Handler:
+    """
+    Times every emit of the handler into LOG_HANDLER_EMIT_DURATION
+    """
+    histogram = LOG_HANDLER_EMIT_DURATION.labels(type(handler).__name__)
+    emit = handler.emit
+
+    @wraps(emit)
+    def timed_emit(record):
+        started_at = time.perf_counter()
+        try:
+            emit(record)
+        finally:
+            histogram.observe(time.perf_counter() - started_at)
+
+    handler.emit = timed_emit
+
+    return handler
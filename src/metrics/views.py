@@ -0,0 +1,43 @@
+from functools import partial
+
+from flask import g, request, Response
+
+from src import app
+from src.metrics.metrics import REGISTRY, request_stats
+
+
+def get_endpoint() -> str:
+    # the route pattern keeps the label cardinality bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_SETTINGS']['enabled']:
+        request_stats.start()
+
+
+@app.after_request
+def record_request_metrics(response):
+    finish = partial(request_stats.finish, get_endpoint(), request.method, response.status_code)
+
+    # a streamed body is generated after this hook, the request ends when the response is closed
+    if response.is_streamed:
+        response.call_on_close(finish)
+        g.request_metrics_on_close = True
+    else:
+        finish()
+
+    return response
+
+
+@app.teardown_request
+def record_failed_request_metrics(exception=None):
+    # after_request does not run when the view raised
+    if not g.get('request_metrics_on_close'):
+        request_stats.finish(get_endpoint(), request.method, 500)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
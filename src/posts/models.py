@@ -1,25 +1,71 @@
-from typing import override, Iterable
+from datetime import datetime
+from typing import override, Iterable, Iterator, Optional
 
-from mongoengine import StringField, ReferenceField, CASCADE, ValidationError
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine import StringField, ReferenceField, CASCADE, ValidationError, IntField, DateTimeField, signals
 
-from src.base_classes import BaseModel
+from src.base_classes import BaseModel, CollectionVersion, utcnow
 from src.user.models import User
 
 
 class Posts(BaseModel):
+    PUBLIC_FIELDS = ('id', 'title', 'text', 'author')
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+    VERSION_FIELDS = ('version', 'updated_at')
+
     title = StringField(max_length=64, required=True, null=False, min_length=1)
     text = StringField(max_length=512, required=True, null=False, min_length=1)
     author = ReferenceField(User, required=True, null=False, reverse_delete_rule=CASCADE)
+    # posts saved before versioning have no version, the first $inc has to change it
+    version = IntField(default=0)
+    updated_at = DateTimeField(default=utcnow)
+
+    @property
+    def author_id(self) -> Optional[ObjectId]:
+        """
+        Id of the author as stored in the post. Reading self.author would
+        dereference it with an extra User query.
+        """
+        author = self._data.get('author')
+
+        return getattr(author, 'id', author)
 
     @override
-    def to_json(self, *args, **kwargs) -> dict:
+    def to_json(self, *args, author: Optional[User] = None, **kwargs) -> dict:
         return {
             'id': str(self.id),
             'title': self.title,
             'text': self.text,
-            'author': str(self.author.id)
+            'author': self.serialize_author(author) if author else str(self.author_id)
         }
 
+    @staticmethod
+    def serialize_author(author: User) -> dict:
+        return {'id': str(author.id), **author.to_json()}
+
+    @classmethod
+    def expand_authors(cls, posts: list[dict]) -> list[dict]:
+        """
+        Replaces the author ids of serialized posts with the authors,
+        fetched with a single $in query for the whole list
+        """
+        author_ids = {post['author'] for post in posts if 'author' in post}
+        if not author_ids:
+            return posts
+
+        authors = {
+            str(author.id): cls.serialize_author(author)
+            for author in User.objects(id__in=list(author_ids)).only('email', 'first_name', 'last_name')
+        }
+
+        for post in posts:
+            if 'author' in post:
+                post['author'] = authors.get(post['author'], post['author'])
+
+        return posts
+
     @classmethod
     def make_a_post(cls, **kwargs) -> BaseModel:
         cls.are_fields_valid(**kwargs)
@@ -27,6 +73,7 @@ class Posts(BaseModel):
         created_post = cls(**kwargs)
 
         created_post.save()
+        CollectionVersion.bump(cls._meta['collection'])
 
         return created_post
 
@@ -39,22 +86,154 @@ class Posts(BaseModel):
 
         return post
 
+    @classmethod
+    def get_post_version(cls, post_id: str) -> Optional[tuple[int, datetime]]:
+        """
+        Returns the version and the time of the last change of the post,
+        reading only these fields and not constructing the document
+        """
+        post = cls.objects(id=post_id).only(*cls.VERSION_FIELDS).as_pymongo().first()
+
+        if not post:
+            return None
+
+        return post.get('version', 0), post.get('updated_at')
+
+    @classmethod
+    def get_collection_version(cls) -> tuple[int, Optional[datetime]]:
+        return CollectionVersion.get_version(cls._meta['collection'])
+
     @classmethod
     def get_all_posts(cls) -> Iterable[BaseModel]:
         return cls.objects().all()
 
+    @classmethod
+    def parse_fields(cls, fields: Optional[str]) -> tuple[str, ...]:
+        if not fields:
+            return cls.PUBLIC_FIELDS
+
+        requested_fields = [field.strip() for field in fields.split(',') if field.strip()]
+        for field in requested_fields:
+            if field not in cls.PUBLIC_FIELDS:
+                raise ValidationError(f"'{field}' is not a valid field")
+
+        return tuple(dict.fromkeys(['id', *requested_fields]))
+
+    @classmethod
+    def iterate_posts(
+            cls,
+            after: Optional[str] = None,
+            fields: Iterable[str] = PUBLIC_FIELDS,
+            limit: Optional[int] = None,
+            batch_size: int = 100
+    ) -> Iterator[dict]:
+        """
+        Returns an iterator of serialized posts in id order, read straight from
+        the MongoDB cursor: only the requested fields are fetched, no Document
+        is constructed and nothing is cached, so memory use stays constant
+        """
+        fields = tuple(fields)
+        queryset = cls.objects(id__gt=cls.__parse_post_id(after)) if after else cls.objects()
+        queryset = queryset.no_cache().order_by('id').only(*fields).batch_size(batch_size).as_pymongo()
+
+        if limit:
+            queryset = queryset.limit(limit)
+
+        return (cls.__serialize_raw(document, fields) for document in queryset)
+
+    @classmethod
+    def get_posts_page(
+            cls,
+            limit: int = DEFAULT_PAGE_SIZE,
+            after: Optional[str] = None,
+            fields: Iterable[str] = PUBLIC_FIELDS
+    ) -> tuple[list[dict], Optional[str]]:
+        """
+        Returns up to limit posts with ids greater than after, and
+        the cursor of the next page (None on the last page)
+        """
+        limit = max(1, min(limit, cls.MAX_PAGE_SIZE))
+        posts = list(cls.iterate_posts(after, fields, limit + 1))
+
+        if len(posts) <= limit:
+            return posts, None
+
+        posts = posts[:limit]
+
+        return posts, posts[-1]['id']
+
+    @staticmethod
+    def __serialize_raw(document: dict, fields: tuple[str, ...]) -> dict:
+        post = {}
+
+        for field in fields:
+            if field == 'id':
+                post['id'] = str(document['_id'])
+            elif field == 'author':
+                post['author'] = str(document['author'])
+            else:
+                post[field] = document.get(field)
+
+        return post
+
+    @staticmethod
+    def __parse_post_id(post_id: str) -> ObjectId:
+        try:
+            return ObjectId(post_id)
+        except (InvalidId, TypeError):
+            raise ValidationError(f"'{post_id}' is not a valid cursor")
+
     def verify_users_access(self, user: User) -> None:
-        if self.author != user:
+        if self.author_id != user.id:
             raise ValidationError('You have no access to do this action!')
 
-    def update_fields(self, user: User, **kwargs) -> None:
-        self.are_fields_valid(**kwargs)
+    @classmethod
+    def update_post(cls, post_id: str, user: User, **kwargs) -> tuple[dict, BaseModel]:
+        """
+        Updates the post with a single atomic find-and-modify filtered on
+        its id and author. Returns the old values of the updated fields,
+        taken from the pre-image, and the post with the update applied.
+        The post is only looked up again when nothing was modified, to tell
+        a missing post from a post of another user
+        """
+        cls.are_fields_valid(**kwargs)
 
-        self.verify_users_access(user)
+        for field in cls.VERSION_FIELDS:
+            if field in kwargs:
+                raise ValidationError(f"'{field}' can not be changed")
 
-        self.update(**kwargs)
+        updated_at = utcnow()
+        post = cls.objects(id=post_id, author=user.id).modify(
+            new=False, inc__version=1, set__updated_at=updated_at, **kwargs
+        )
+
+        if not post:
+            cls.get_post_by_id(post_id)
+
+            raise ValidationError('You have no access to do this action!')
+
+        old_field_version = {field: post[field] for field in post._fields if field in kwargs}
+
+        for field, value in kwargs.items():
+            setattr(post, field, value)
+        post.version += 1
+        post.updated_at = updated_at
+
+        CollectionVersion.bump(cls._meta['collection'])
+
+        return old_field_version, post
 
     def delete_post(self, user: User) -> None:
         self.verify_users_access(user)
 
         self.delete()
+        CollectionVersion.bump(self.get_table_name())
+
+
+def bump_posts_version(sender, document, **kwargs) -> None:
+    # expanded posts embed their author, and deleting a user deletes their posts
+    CollectionVersion.bump(Posts._meta['collection'])
+
+
+signals.post_save.connect(bump_posts_version, sender=User)
+signals.post_delete.connect(bump_posts_version, sender=User)
@@ -1,19 +1,107 @@
-from flask import request
+import hashlib
+import json
+from datetime import datetime, UTC
+from itertools import batched
+from typing import Optional
+
+from flask import request, Response, stream_with_context
 from flask_restful import Resource
 from mongoengine import ValidationError
 
 from src import logger, LoggerMessageTemplates
 from src.posts.models import Posts
+from src.user.models import User
 from src.user.utils import jwt_optional, get_user_instance_by_jwt_token
 
 
+def get_validators(etag: str, updated_at: Optional[datetime]) -> dict:
+    """
+    Returns the ETag and Last-Modified headers of a representation
+    """
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+
+    if updated_at:
+        headers['Last-Modified'] = updated_at.replace(tzinfo=UTC).strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+    return headers
+
+
+def is_not_modified(etag: str, updated_at: Optional[datetime]) -> bool:
+    """
+    Evaluates If-None-Match, or If-Modified-Since when the request has no
+    If-None-Match, against the validators of the current representation
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since and updated_at:
+        return updated_at.replace(tzinfo=UTC, microsecond=0) <= request.if_modified_since
+
+    return False
+
+
 class PostsCollectionView(Resource):
     def get(self):
         logger.info(LoggerMessageTemplates.get_endpoint_was_called_log(request))
 
-        posts = Posts.get_all_posts()
+        # the listing changes only when the collection version does, so a poll
+        # that already has the current version is answered without querying posts
+        version, updated_at = Posts.get_collection_version()
+        etag = f'{version}-{hashlib.sha1(request.query_string).hexdigest()[:16]}'
+        validators = get_validators(etag, updated_at)
+
+        if is_not_modified(etag, updated_at):
+            return Response(status=304, headers=validators)
+
+        after = request.args.get('after')
+
+        try:
+            fields = Posts.parse_fields(request.args.get('fields'))
+
+            expand_author = request.args.get('expand') == 'author'
 
-        return {'posts': posts.to_json()}, 200
+            if request.args.get('stream', '').lower() in ('1', 'true'):
+                posts = Posts.iterate_posts(after, fields, request.args.get('limit', type=int))
+
+                return Response(
+                    stream_with_context(self.__stream_posts(posts, expand_author)),
+                    mimetype='application/json',
+                    headers=validators
+                )
+
+            posts, next_cursor = Posts.get_posts_page(
+                request.args.get('limit', Posts.DEFAULT_PAGE_SIZE, type=int),
+                after,
+                fields
+            )
+        except ValidationError as exception:
+            return {'error': exception.message}, 400
+
+        if expand_author:
+            Posts.expand_authors(posts)
+
+        return {'posts': posts, 'next': next_cursor}, 200, validators
+
+    @staticmethod
+    def __stream_posts(posts, expand_author: bool = False, batch_size: int = 100):
+        """
+        Writes the listing as JSON one post at a time, so the response
+        starts right away and never holds the whole collection.
+        Authors are expanded once per batch of posts.
+        """
+        yield '{"posts": ['
+
+        separator = ''
+        for batch in batched(posts, batch_size):
+            batch = list(batch)
+            if expand_author:
+                Posts.expand_authors(batch)
+
+            for post in batch:
+                yield separator + json.dumps(post)
+                separator = ','
+
+        yield '], "next": null}'
 
     @jwt_optional
     def post(self):
@@ -47,9 +135,40 @@ class PostsDetailedView(Resource):
     def get(self, post_id: str):
         logger.info(LoggerMessageTemplates.get_endpoint_was_called_log(request))
 
-        posts = Posts.get_post_by_id(post_id)
+        expand_author = request.args.get('expand') == 'author'
+
+        # the version alone answers a conditional request, the post is loaded only when it changed
+        post_version = Posts.get_post_version(post_id) if request.if_none_match or request.if_modified_since else None
+        if post_version:
+            etag, updated_at = self.__get_validators(post_id, *post_version, expand_author)
 
-        return {'posts': posts.to_json()}, 200
+            if is_not_modified(etag, updated_at):
+                return Response(status=304, headers=get_validators(etag, updated_at))
+
+        posts = Posts.get_post_by_id(post_id)
+        author = User.get_user_by_id(posts.author_id) if expand_author else None
+        etag, updated_at = self.__get_validators(post_id, posts.version, posts.updated_at, expand_author)
+
+        return {'posts': posts.to_json(author=author)}, 200, get_validators(etag, updated_at)
+
+    @staticmethod
+    def __get_validators(
+            post_id: str,
+            version: int,
+            updated_at: Optional[datetime],
+            expand_author: bool
+    ) -> tuple[str, Optional[datetime]]:
+        """
+        Returns the ETag and the time of the last change of a post. An expanded
+        post also embeds its author, whose changes only bump the collection version
+        """
+        if not expand_author:
+            return f'{post_id}-{version}', updated_at
+
+        collection_version, collection_updated_at = Posts.get_collection_version()
+        updated_at = max(filter(None, (updated_at, collection_updated_at)), default=None)
+
+        return f'{post_id}-{version}-author-{collection_version}', updated_at
 
     @jwt_optional
     def patch(self, post_id: str):
@@ -57,18 +176,17 @@ class PostsDetailedView(Resource):
         data = request.json
 
         try:
-            post = Posts.get_post_by_id(post_id)
-            post.update_fields(current_user, **data)
+            old_field_version, post = Posts.update_post(post_id, current_user, **data)
 
             logger.info(
                 LoggerMessageTemplates.get_changed_record_log(
                     current_user,
                     post,
-                    data,
+                    old_field_version,
+                    {field: post[field] for field in data},
                     request
                 )
             )
-            post.reload()
         except ValidationError as exception:
             logger.error(
                 LoggerMessageTemplates.get_error_with_authenticated_user_log(
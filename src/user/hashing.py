@@ -0,0 +1,133 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from typing import Callable, Optional
+
+from bcrypt import hashpw, gensalt, checkpw
+from flask import current_app, has_app_context
+
+from src.config import Config
+from src.metrics.metrics import PASSWORD_HASHING_DURATION
+
+
+class PasswordHashingOverloaded(Exception):
+    """
+    Raised instead of queueing a password hash or check
+    once max_pending of them are already waiting
+    """
+
+
+class PasswordHasher:
+    """
+        description:
+            Runs bcrypt off the request threads in a pool of `workers`
+            processes, so a burst of logins can't starve the other endpoints
+            of CPU. At most `max_pending` operations may be queued or running,
+            further ones fail fast with PasswordHashingOverloaded. An operation
+            whose caller timed out keeps its slot until it is cancelled or done.
+            With 0 workers bcrypt runs inline.
+
+            Settings are read from PASSWORD_HASHING_SETTINGS of the current app
+            (or Config outside of an app context) unless they are given.
+
+        methods:
+            hash: returns the bcrypt hash of a password with the configured rounds.
+
+            verify: checks a password against a bcrypt hash.
+
+            needs_rehash: tells whether a hash was made with other rounds
+            than the configured ones.
+    """
+    def __init__(self, settings: Optional[dict] = None):
+        self.settings = settings
+
+        self._executor = None
+        self._executor_workers = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def get_settings(self) -> dict:
+        if self.settings is not None:
+            return self.settings
+
+        if has_app_context():
+            return current_app.config.get('PASSWORD_HASHING_SETTINGS', Config.PASSWORD_HASHING_SETTINGS)
+
+        return Config.PASSWORD_HASHING_SETTINGS
+
+    def hash(self, password: str) -> str:
+        salt = gensalt(self.get_settings()['rounds'])
+
+        return self.__timed('hash', hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self.__timed('verify', checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return self.get_rounds(hashed_password) != self.get_settings()['rounds']
+
+    @staticmethod
+    def get_rounds(hashed_password: str) -> int:
+        # bcrypt hashes look like $2b$<rounds>$<salt and hash>
+        return int(hashed_password.split('$')[2])
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown()
+            self._executor = None
+
+    def __timed(self, operation: str, function: Callable, *args):
+        started_at = time.perf_counter()
+        try:
+            return self.__run(function, *args)
+        finally:
+            PASSWORD_HASHING_DURATION.labels(operation).observe(time.perf_counter() - started_at)
+
+    def __run(self, function: Callable, *args):
+        settings = self.get_settings()
+
+        if not settings['workers']:
+            return function(*args)
+
+        with self._lock:
+            if self._pending >= settings['max_pending']:
+                raise PasswordHashingOverloaded('Too many password operations are pending')
+
+            self._pending += 1
+            executor = self.__get_executor(settings['workers'])
+
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            self.__release()
+            raise
+
+        # the slot is held until the job is done, not until the caller stops waiting,
+        # so operations that timed out still count against max_pending
+        future.add_done_callback(self.__release)
+
+        try:
+            return future.result(timeout=settings['timeout'])
+        except TimeoutError:
+            future.cancel()
+            raise PasswordHashingOverloaded('Password operation timed out')
+
+    def __release(self, future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def __get_executor(self, workers: int) -> ProcessPoolExecutor:
+        if self._executor is None or self._executor_workers != workers:
+            if self._executor:
+                self._executor.shutdown(wait=False)
+
+            # spawn: forking a process that runs request threads is unsafe
+            self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            self._executor_workers = workers
+
+        return self._executor
+
+
+password_hasher = PasswordHasher()
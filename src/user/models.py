@@ -1,9 +1,9 @@
 from typing import override
 
-from mongoengine import StringField, ValidationError
-from bcrypt import hashpw, gensalt, checkpw
+from mongoengine import NotUniqueError, StringField, ValidationError
 
 from src.base_classes import BaseModel
+from src.user.hashing import password_hasher
 
 
 class User(BaseModel):
@@ -13,11 +13,19 @@ class User(BaseModel):
     password = StringField(max_length=256, required=True)
 
     def set_password(self, password) -> None:
-        hashed_password = hashpw(password.encode('utf-8'), gensalt())
-        self.password = hashed_password.decode('utf-8')
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password: str) -> bool:
-        return checkpw(password.encode('utf-8'), self.password.encode('utf-8'))
+        return password_hasher.verify(password, self.password)
+
+    def rehash_password_if_needed(self, password: str) -> None:
+        """
+        Re-hashes a verified password when it was stored with
+        other bcrypt rounds than the configured ones
+        """
+        if password_hasher.needs_rehash(self.password):
+            self.set_password(password)
+            self.save()
 
     @classmethod
     def get_user_by_id(cls, id: str) -> BaseModel:
@@ -32,16 +40,16 @@ class User(BaseModel):
         if not kwargs['email'] or not kwargs['password']:
             raise ValidationError('Email and Password fields are required!')
 
-        is_email_taken = True if cls.get_user_by_email(kwargs['email']) else False
-
-        if is_email_taken:
-            raise ValidationError('Email is already taken!')
-
         password = kwargs.pop('password')
 
         created_user = cls(**kwargs)
         created_user.set_password(password)
-        created_user.save()
+
+        try:
+            # the unique index on email rejects a taken email in the same round trip as the insert
+            created_user.save(force_insert=True)
+        except NotUniqueError:
+            raise ValidationError('Email is already taken!')
 
         return created_user
 
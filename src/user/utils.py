@@ -1,9 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from typing import Any, Hashable, Optional
+
+from bson import ObjectId
+from flask import current_app, g, has_app_context
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
+from mongoengine import signals
 
 from src.base_classes import BaseModel
+from src.config import Config
 from src.user.models import User
 
+IDENTITY_CLAIMS = ('email', 'first_name', 'last_name')
+
+
+class TTLCache:
+    """
+        description:
+            Thread-safe LRU cache whose entries also expire ttl seconds
+            after they were stored.
+
+        methods:
+            get: returns the cached value or None when it is missing or expired.
+
+            set: stores a value, evicting the least recently used entry
+            once max_size is reached.
+
+            invalidate: removes a single entry.
+
+            clear: removes every entry.
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = TTLCache(Config.USER_CACHE_SETTINGS['max_size'], Config.USER_CACHE_SETTINGS['ttl'])
+
+
+def invalidate_cached_user(sender, document, **kwargs) -> None:
+    user_cache.invalidate(str(document.id))
+
+    if has_app_context() and g.get('current_user') is not None and g.current_user.id == document.id:
+        g.pop('current_user')
+
+
+signals.post_save.connect(invalidate_cached_user, sender=User)
+signals.post_delete.connect(invalidate_cached_user, sender=User)
+
 
 def jwt_optional(fn):
     @wraps(fn)
@@ -22,9 +102,48 @@ def jwt_optional(fn):
     return wrapper
 
 
+def get_identity_claims(user: User) -> dict:
+    """
+    Returns the claims embedded into access tokens when
+    USER_CACHE_SETTINGS['jwt_identity_claims'] is enabled
+    """
+    if not current_app.config['USER_CACHE_SETTINGS']['jwt_identity_claims']:
+        return {}
+
+    return {claim: user[claim] for claim in IDENTITY_CLAIMS}
+
+
 def get_user_instance_by_jwt_token() -> BaseModel:
+    """
+    Returns the user of the current access token. The user is looked up at most once
+    per request and is built from the identity claims in the process-wide cache (or
+    in the token, when they are enabled) before falling back to the database. Saves
+    in other processes only reach the cache when its entry expires, after at most
+    USER_CACHE_SETTINGS['ttl'] seconds.
+    """
     current_user_id = get_jwt_identity()
 
-    user = User.get_user_by_id(current_user_id)
+    user = g.get('current_user')
+    if user is not None and str(user.id) == current_user_id:
+        return user
+
+    settings = current_app.config['USER_CACHE_SETTINGS']
+    claims = get_jwt()
+
+    if settings['jwt_identity_claims'] and all(claim in claims for claim in IDENTITY_CLAIMS):
+        user = User(id=ObjectId(current_user_id), **{claim: claims[claim] for claim in IDENTITY_CLAIMS})
+    else:
+        cached_claims = user_cache.get(current_user_id) if settings['enabled'] else None
+
+        if cached_claims is not None:
+            user = User(id=ObjectId(current_user_id), **dict(cached_claims))
+        else:
+            user = User.get_user_by_id(current_user_id)
+
+            # the claims, not the Document, which is mutable and would be shared by the request threads
+            if user is not None and settings['enabled']:
+                user_cache.set(current_user_id, tuple((claim, user[claim]) for claim in IDENTITY_CLAIMS))
+
+    g.current_user = user
 
     return user
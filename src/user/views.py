@@ -7,7 +7,11 @@ from mongoengine import ValidationError
 
 from src import logger, LoggerMessageTemplates
 
+from src.user.hashing import PasswordHashingOverloaded
 from src.user.models import User
+from src.user.utils import get_identity_claims
+
+SERVER_IS_BUSY_RESPONSE = {'message': 'Server is busy, try again later'}, 503, {'Retry-After': '1'}
 
 
 class AuthRegister(Resource):
@@ -19,6 +23,8 @@ class AuthRegister(Resource):
         except ValidationError as exception:
             logger.error(LoggerMessageTemplates.get_error_log(exception.message, request))
             return {'error': exception.message}, 400
+        except PasswordHashingOverloaded:
+            return SERVER_IS_BUSY_RESPONSE
 
         return {"message": "User has been registered successfully", "created_user": user.to_json()}, 201
 
@@ -29,11 +35,20 @@ class AuthLogin(Resource):
 
         user = User.get_user_by_email(auth.get('email'))
 
-        if not user or not User.check_password(user, auth.get('password', '')):
+        try:
+            if not user or not User.check_password(user, auth.get('password', '')):
+
+                return {'message': 'wrong credentials!'}, 401
 
-            return {'message': 'wrong credentials!'}, 401
+            user.rehash_password_if_needed(auth['password'])
+        except PasswordHashingOverloaded:
+            return SERVER_IS_BUSY_RESPONSE
 
-        access_token = create_access_token(identity=str(user.id), expires_delta=datetime.timedelta(hours=1))
+        access_token = create_access_token(
+            identity=str(user.id),
+            expires_delta=datetime.timedelta(hours=1),
+            additional_claims=get_identity_claims(user)
+        )
 
         logger.info(LoggerMessageTemplates.get_logged_user_log(user))
 
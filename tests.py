@@ -1,14 +1,53 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import logging
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mongomock
+import pymongo
 import pytest
+from bson import DBRef, ObjectId
+from flask import g
+from flask_jwt_extended import verify_jwt_in_request
 from flask_mongoengine import MongoEngine
 
-from mongoengine import disconnect
+from mongoengine import disconnect, ValidationError
+from mongoengine.connection import get_db
 
+from benchmarks import endpoints
+from benchmarks.runner import compare_results
+from src.base_classes import CollectionVersion
 from src.config import TestConfig, Config
 
-from src import app
-from src.logger.models import LoggerModel
+from src import app, logger
+from src.logger.broadcast import LogBroadcaster, TooManySubscribers
+from src.logger.buffering import BufferedRotatingFileHandler, BufferedStreamHandler
+from src.logger.collector import (
+    CollectorClientHandler, FRAME_HEADER, LogCollector, MAX_FRAME_SIZE, serialize_record
+)
+from src.logger.export import main as export_main
+from src.logger.logger import AsyncDatabaseHandler, DatabaseHandler, LogMessage, LogMessageFilter, LoggerFactory
+from src.logger.models import LoggerModel, LogRollup, get_storage_meta
+from src.logger.rotation import RotatingCompressedFileHandler, find_segments, read_segment_index
+from src.logger.sampling import SamplingFilter
+from src.logger.spool import LogSpool, SegmentSpool
+from src.metrics.metrics import (
+    Counter, Histogram, HTTP_REQUEST_DURATION, HTTP_REQUEST_MONGODB_COMMANDS, LOG_HANDLER_EMIT_DURATION,
+    MongoCommandListener, MongoPoolListener, MONGODB_COMMANDS, MONGODB_POOL_CHECKOUTS, MONGODB_POOL_WAIT_DURATION,
+    request_stats
+)
 from src.posts.models import Posts
+from src.user.hashing import PasswordHasher, PasswordHashingOverloaded
 from src.user.models import User
+from src.user.utils import get_user_instance_by_jwt_token, user_cache
 
 
 @pytest.fixture
@@ -18,18 +57,23 @@ def app_test():
     app_context.push()
 
     disconnect(alias='default')
+    disconnect(alias=Config.LOGGER_CONNECTION_SETTINGS['alias'])
 
     db = MongoEngine(app)
 
     Posts.drop_collection()
     User.drop_collection()
     LoggerModel.drop_collection()
+    LogRollup.drop_collection()
+    CollectionVersion.drop_collection()
 
     yield app
 
     Posts.drop_collection()
     User.drop_collection()
     LoggerModel.drop_collection()
+    LogRollup.drop_collection()
+    CollectionVersion.drop_collection()
     app_context.pop()
     app.config.from_object(Config)
 
@@ -60,6 +104,12 @@ def login_dummy_user(client):
     })
 
 
+def allow_several_posts():
+    # users and posts share the base_model collection, and its unique email index
+    # rejects every post after the first one as a user without an email
+    User._get_collection().drop_index('email_1')
+
+
 def create_post(client, access_token):
     return client.post('/posts', json={
         'title': 'Test Post',
@@ -99,6 +149,20 @@ def test_register_duplicated_user(client):
     assert log
 
 
+def test_concurrent_registrations_create_one_user(client):
+    barrier = threading.Barrier(8)
+
+    def register(_):
+        barrier.wait()
+        return create_user(app.test_client()).status_code
+
+    with ThreadPoolExecutor(8) as executor:
+        status_codes = list(executor.map(register, range(8)))
+
+    assert sorted(status_codes) == [201] + [400] * 7
+    assert User.objects(email='test@example.com').count() == 1
+
+
 def test_login_user(client):
     create_user(client)
 
@@ -219,6 +283,56 @@ def test_validation_error_in_update_post(client):
     assert log is not None
 
 
+def test_update_post_is_a_single_find_and_modify(client, monkeypatch):
+    create_user(client)
+    access_token = login_dummy_user(client).json['access_token']
+    post_id = create_post(client, access_token).json['post']['id']
+
+    client.post('/register', json={'email': 'other@example.com', 'password': 'password123'})
+    other_access_token = client.get(
+        '/login', json={'email': 'other@example.com', 'password': 'password123'}
+    ).json['access_token']
+
+    calls, nested = [], []
+    collection_type = type(Posts._get_collection())
+    for name in ('find', 'find_one_and_update', 'update_one'):
+        def counting_method(collection, *args, method=getattr(collection_type, name), name=name, **kwargs):
+            # mongomock implements find_one_and_update with find, count only the outermost calls
+            if not nested and collection.name == 'base_model':
+                calls.append(name)
+
+            nested.append(name)
+            try:
+                return method(collection, *args, **kwargs)
+            finally:
+                nested.pop()
+
+        monkeypatch.setattr(collection_type, name, counting_method)
+
+    response = client.patch(f'/posts/{post_id}', json={'title': 'Updated Test Post'}, headers={
+        'Authorization': f'Bearer {access_token}'
+    })
+    assert response.status_code == 200
+    assert response.json['post']['title'] == 'Updated Test Post'
+    assert calls == ['find_one_and_update']
+
+    log = get_log(info_type='INFO', template='user_changed_the_field')
+    assert log.params['old_version'] == {'title': 'Test Post'}
+    assert log.params['new_version'] == {'title': 'Updated Test Post'}
+
+    response = client.patch(f'/posts/{post_id}', json={'title': 'Stolen Post'}, headers={
+        'Authorization': f'Bearer {other_access_token}'
+    })
+    assert response.status_code == 400
+    assert b'You have no access to do this action!' in response.data
+    assert Posts.get_post_by_id(post_id).title == 'Updated Test Post'
+
+    response = client.patch('/posts/668a700a1a4e4bcaa7490904', json={'title': 'Missing Post'}, headers={
+        'Authorization': f'Bearer {access_token}'
+    })
+    assert b'Post with id 668a700a1a4e4bcaa7490904 does not exist!' in response.data
+
+
 def test_delete_post(client):
     create_user(client)
 
@@ -260,3 +374,1325 @@ def test_delete_unreal_post(client):
     assert log is not None
 
 
+def make_record(message: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.makeLogRecord({
+        'name': 'tests',
+        'levelno': level,
+        'levelname': logging.getLevelName(level),
+        'msg': message
+    })
+
+
+def test_async_database_handler_writes_batches(app_test):
+    handler = AsyncDatabaseHandler(batch_size=2, max_latency=60)
+
+    for index in range(5):
+        handler.emit(make_record(f'record {index}'))
+
+    handler.flush()
+
+    assert LoggerModel.objects(log_file='tests').count() == 5
+    assert get_log(message='record 4')
+
+    handler.close()
+
+
+def test_async_database_handler_overflow_policies(app_test, monkeypatch):
+    writing = threading.Event()
+    release = threading.Event()
+    create_logs = LoggerModel.create_logs
+
+    def blocked_create_logs(logs):
+        writing.set()
+        release.wait()
+        return create_logs(logs)
+
+    monkeypatch.setattr(LoggerModel, 'create_logs', blocked_create_logs)
+
+    for policy, kept_messages in (
+            ('drop_newest', ['record 0', 'record 1', 'record 2']),
+            ('drop_oldest', ['record 0', 'record 2', 'record 3'])
+    ):
+        LoggerModel.drop_collection()
+        writing.clear()
+        release.clear()
+
+        handler = AsyncDatabaseHandler(batch_size=1, max_latency=0, queue_size=2, overflow_policy=policy)
+
+        handler.emit(make_record('record 0'))
+        writing.wait()
+
+        for index in range(1, 4):
+            handler.emit(make_record(f'record {index}'))
+
+        assert handler.dropped == 1
+
+        release.set()
+        handler.close()
+
+        assert sorted(log.message for log in LoggerModel.objects(log_file='tests')) == kept_messages
+
+
+def test_async_database_handler_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        AsyncDatabaseHandler(overflow_policy='ignore')
+
+
+def test_logs_keyset_pagination(client):
+    started_at = datetime.datetime.now().replace(microsecond=0)
+    LoggerModel.create_logs([
+        {'log_file': 'tests', 'info_type': 'INFO', 'message': f'record {index}',
+         'date_and_time': started_at + datetime.timedelta(minutes=index // 2)}
+        for index in range(5)
+    ])
+
+    seen, cursor = [], None
+    while True:
+        logs, cursor = LoggerModel.get_logs_page('date_and_time', 'asc', cursor=cursor, page_size=2)
+        seen.extend(log.message for log in logs)
+        if not cursor:
+            break
+
+    assert seen == [f'record {index}' for index in range(5)]
+
+    logs, cursor = LoggerModel.get_logs_page('info_type', 'desc', page_size=10)
+    assert len(logs) == 5 and cursor is None
+
+
+def test_logs_page_rejects_invalid_arguments(client):
+    with pytest.raises(ValidationError):
+        LoggerModel.get_logs_page('message')
+
+    response = client.get('/?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+    response = client.get('/?sort_by=message&page_size=1000')
+    assert response.status_code == 200
+
+
+def test_logs_search_ranks_by_relevance(client):
+    create_user(client)
+    login_dummy_user(client)
+    LoggerModel.create_log(log_file='tests', info_type='INFO', message='example page was opened')
+
+    log = get_log(message='User test@example.com, Test User was created successfully')
+    assert log.search_terms == ['test@example.com']
+
+    logs, cursor = LoggerModel.get_logs_page(LoggerModel.RELEVANCE, search='example', page_size=2)
+    assert cursor is not None
+    assert 'test@example.com' in logs[0].message
+
+    logs, cursor = LoggerModel.get_logs_page(LoggerModel.RELEVANCE, search='example', cursor=cursor, page_size=2)
+    assert [log.message for log in logs] == ['example page was opened']
+    assert cursor is None
+
+    logs, _ = LoggerModel.get_logs_page('date_and_time', search='logged')
+    assert [log.message for log in logs] == ['User test@example.com, Test User has logged in']
+
+    response = client.get('/?search=opened')
+    assert b'example page was opened' in response.data
+    assert b'has logged in' not in response.data
+
+
+def test_structured_log_fields_are_stored(client):
+    create_user(client)
+
+    response = login_dummy_user(client)
+    access_token = response.json['access_token']
+
+    response = create_post(client, access_token)
+    post_id = response.json['post']['id']
+
+    log = get_log(template='user_created_the_table_record', params__record_id=post_id)
+    assert log.params['email'] == 'test@example.com'
+    assert log.params['endpoint'] == '/posts'
+    assert log.params['method'] == 'POST'
+    assert log.params['table_name'] == 'base_model'
+    assert log.search_terms == ['test@example.com', '/posts', 'base_model']
+
+    assert LoggerModel.objects(params__user_id=log.params['user_id']).count() == 3
+
+
+def test_long_log_messages_are_not_truncated(app_test):
+    message = 'x' * 2048
+
+    LoggerModel.create_log(log_file='tests', info_type='INFO', message=message)
+
+    assert get_log(log_file='tests').message == message
+
+
+def test_lazy_log_messages_skip_disabled_levels():
+    resolved = []
+
+    def get_params() -> dict:
+        resolved.append(True)
+        return {'endpoint': '/posts', 'method': 'GET'}
+
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setLevel(logging.ERROR)
+
+    lazy_logger = logging.getLogger('tests.lazy')
+    lazy_logger.setLevel(logging.DEBUG)
+    lazy_logger.propagate = False
+    lazy_logger.addHandler(handler)
+    lazy_logger.addFilter(LogMessageFilter(lazy_logger))
+
+    lazy_logger.info(LogMessage('endpoint_was_called', get_params))
+    assert resolved == []
+    assert stream.getvalue() == ''
+
+    lazy_logger.error(LogMessage('endpoint_was_called', get_params))
+    assert resolved == [True]
+    assert stream.getvalue() == '/posts was called with method GET\n'
+
+
+def test_sampling_filter_suppresses_and_summarizes(app_test):
+    resolved = []
+
+    def get_params() -> dict:
+        resolved.append(True)
+        return {'endpoint': '/posts', 'method': 'GET'}
+
+    stream = io.StringIO()
+    sampled_logger = logging.getLogger('tests.sampling')
+    sampled_logger.setLevel(logging.INFO)
+    sampled_logger.propagate = False
+    sampled_logger.addHandler(logging.StreamHandler(stream))
+
+    sampling_filter = SamplingFilter(
+        sampled_logger, ratios={'endpoint_was_called': 0}, rate=0.001, burst=2, summary_interval=3600
+    )
+    sampled_logger.addFilter(sampling_filter)
+    sampled_logger.addFilter(LogMessageFilter(sampled_logger))
+
+    try:
+        with app.test_request_context('/posts', method='GET'):
+            for _ in range(100):
+                sampled_logger.info(LogMessage('endpoint_was_called', get_params))
+            sampled_logger.error(LogMessage('endpoint_was_called', get_params))
+
+            for _ in range(5):
+                sampled_logger.info(LogMessage('user_entered_the_endpoint', {
+                    'email': 'test@example.com', 'first_name': 'Test', 'last_name': 'User',
+                    'endpoint': '/posts', 'method': 'GET'
+                }))
+
+        # the ratio dropped every INFO record before its params were read, ERROR passed through
+        assert resolved == [True]
+        assert stream.getvalue().count('/posts was called with method GET') == 1
+        assert stream.getvalue().count('entered the') == 2
+
+        sampling_filter.emit_summary()
+        lines = stream.getvalue().splitlines()
+        assert '100 endpoint_was_called log lines in /posts with method GET were suppressed by sampling' in lines
+        # the token bucket let the burst of user_entered_the_endpoint through and suppressed the rest
+        assert '3 user_entered_the_endpoint log lines in /posts with method GET were suppressed by sampling' in lines
+
+        sampling_filter.emit_summary()
+        assert stream.getvalue().splitlines() == lines
+    finally:
+        sampling_filter.close()
+        sampled_logger.filters.clear()
+        sampled_logger.handlers.clear()
+
+
+def test_logger_factory_shutdown_logs_the_last_sampling_summary(app_test, monkeypatch):
+    stream = io.StringIO()
+    sampled_logger = logging.getLogger('tests.sampling_shutdown')
+    sampled_logger.setLevel(logging.INFO)
+    sampled_logger.propagate = False
+    sampled_logger.addHandler(logging.StreamHandler(stream))
+
+    sampling_filter = SamplingFilter(sampled_logger, ratios={'endpoint_was_called': 0}, summary_interval=3600)
+    sampled_logger.addFilter(sampling_filter)
+    sampled_logger.addFilter(LogMessageFilter(sampled_logger))
+    monkeypatch.setitem(LoggerFactory._REGISTRY, 'tests.sampling_shutdown', {'logger': sampled_logger})
+
+    try:
+        with app.test_request_context('/posts', method='GET'):
+            for _ in range(3):
+                sampled_logger.info(LogMessage('endpoint_was_called', {'endpoint': '/posts', 'method': 'GET'}))
+
+        assert stream.getvalue() == ''
+
+        LoggerFactory.shutdown()
+
+        assert stream.getvalue().splitlines() == [
+            '3 endpoint_was_called log lines in /posts with method GET were suppressed by sampling'
+        ]
+    finally:
+        sampled_logger.filters.clear()
+        sampled_logger.handlers.clear()
+
+
+def test_sampling_summary_counts_in_rollups(app_test):
+    LoggerModel.create_logs([
+        {'log_file': 'logging/py.log', 'info_type': 'INFO', 'message': '/posts was called with method GET',
+         'template': 'endpoint_was_called', 'params': {'endpoint': '/posts', 'method': 'GET'}},
+        {'log_file': 'logging/py.log', 'info_type': 'INFO', 'message': 'summary', 'template': 'log_lines_suppressed',
+         'params': {
+             'sampled_template': 'endpoint_was_called', 'suppressed': 99, 'endpoint': '/posts', 'method': 'GET'
+         }},
+    ])
+
+    # logs without a date are dated now, in UTC like the stored dates
+    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    counts = LogRollup.get_counts('minute', now - datetime.timedelta(hours=1), now, ('endpoint',))
+    assert counts == [{'endpoint': '/posts', 'count': 100}]
+
+
+def test_collector_receives_records_from_workers(tmp_path):
+    class CapturingHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(record)
+
+    stream = io.StringIO()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter(LoggerFactory.DEFAULT_FORMAT, datefmt=LoggerFactory.DATE_FORMAT))
+    capturing_handler = CapturingHandler()
+
+    collector = LogCollector(str(tmp_path / 'collector.sock'), [stream_handler, capturing_handler])
+    threading.Thread(target=collector.serve_forever, daemon=True).start()
+
+    client_handlers = [CollectorClientHandler(str(tmp_path / 'collector.sock')) for _ in range(2)]
+    worker_logger = logging.getLogger('tests.collector')
+    worker_logger.setLevel(logging.INFO)
+    worker_logger.propagate = False
+
+    try:
+        for index, client_handler in enumerate(client_handlers):
+            worker_logger.handlers = [client_handler]
+            for record_index in range(50):
+                worker_logger.info(LogMessage('endpoint_was_called', {
+                    'endpoint': f'/posts/{index}', 'method': 'GET'
+                }))
+            worker_logger.error('plain error %s', index)
+
+            client_handler.close()
+
+        deadline = time.monotonic() + 5
+        while len(capturing_handler.records) < 102 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker_logger.handlers = []
+        collector.close()
+
+    assert len(capturing_handler.records) == 102
+    assert all(client_handler.dropped == 0 for client_handler in client_handlers)
+
+    record = next(record for record in capturing_handler.records if '/posts/0 ' in record.getMessage())
+    assert record.name == 'tests.collector'
+    assert record.msg.template == 'endpoint_was_called'
+    assert record.msg.params == {'endpoint': '/posts/0', 'method': 'GET'}
+    assert DatabaseHandler.get_log_fields(record)['message'] == '/posts/0 was called with method GET'
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 102
+
+    # records of a worker keep their order, workers are read concurrently
+    for index in range(2):
+        worker_lines = [line for line in lines if f'/posts/{index} ' in line or line.endswith(f'error {index}')]
+        assert len(worker_lines) == 51
+        assert worker_lines[-1].endswith(f'[ERROR]: plain error {index}')
+    assert not (tmp_path / 'collector.sock').exists()
+
+
+def test_collector_closes_connections_sending_oversized_frames(tmp_path):
+    stream = io.StringIO()
+    socket_path = str(tmp_path / 'collector.sock')
+
+    collector = LogCollector(socket_path, [logging.StreamHandler(stream)])
+    threading.Thread(target=collector.serve_forever, daemon=True).start()
+
+    try:
+        with socket.socket(socket.AF_UNIX) as connection:
+            connection.connect(socket_path)
+            connection.sendall(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1) + b'{}')
+            connection.settimeout(5)
+            assert connection.recv(1) == b''
+
+        with socket.socket(socket.AF_UNIX) as connection:
+            connection.connect(socket_path)
+            connection.sendall(serialize_record(make_record('next connection')))
+
+        deadline = time.monotonic() + 5
+        while not stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        collector.close()
+
+    assert stream.getvalue() == 'next connection\n'
+
+
+def test_collector_script_does_not_build_the_app():
+    script = "import collector, sys; print('src.routes' in sys.modules, logging.getLogger('logging/py.log').handlers)"
+    output = subprocess.run(
+        [sys.executable, '-c', 'import logging; ' + script], capture_output=True, text=True, check=True, timeout=30
+    ).stdout
+
+    assert output == 'False []\n'
+
+
+def test_segment_spool_reads_committed_records_once(tmp_path):
+    spool = SegmentSpool(str(tmp_path), segment_size=256, max_segments=3)
+    records = [f'record {index:02d}'.encode() for index in range(45)]
+
+    # 14 records of 17 bytes fit in a segment, the spool holds 3 segments
+    appended = [spool.append(record) for record in records]
+    assert appended == [True] * 42 + [False] * 3
+
+    read_records, position = spool.read(20)
+    assert read_records == records[:20]
+    spool.commit(position)
+    spool.close()
+
+    # a torn record in the last segment ends the data written to it
+    with open(tmp_path / '000000000002.wal', 'r+b') as segment:
+        segment.seek(5 * 17)
+        segment.write(b'\x00\x00\x00\x10garbage')
+
+    spool = SegmentSpool(str(tmp_path), segment_size=256, max_segments=3)
+    read_records, position = spool.read(100)
+    assert read_records == records[20:33]
+    spool.commit(position)
+
+    assert spool.is_empty()
+    assert [path.name for path in tmp_path.glob('*.wal')] == ['000000000002.wal']
+    assert spool.append(b'after reopen')
+    assert spool.read(10)[0] == [b'after reopen']
+    spool.close()
+
+
+def test_log_spool_degrades_and_replays(app_test, tmp_path):
+    database_is_down = True
+    written = []
+
+    def write_logs(logs):
+        if database_is_down:
+            raise ConnectionError('database is down')
+        LoggerModel.create_logs(logs)
+        written.extend(logs)
+
+    handler = DatabaseHandler(LogSpool(str(tmp_path), replay_interval=3600, write_logs=write_logs))
+
+    try:
+        for index in range(3):
+            handler.emit(logging.makeLogRecord({'levelname': 'INFO', 'msg': f'spooled {index}', 'module': 'tests'}))
+
+        assert handler.spool.degraded
+        assert LoggerModel.objects.count() == 0
+
+        database_is_down = False
+        assert handler.spool.replay() == 3
+        assert not handler.spool.degraded
+        messages = [log.message for log in LoggerModel.objects.order_by('date_and_time')]
+        assert messages == [f'spooled {index}' for index in range(3)]
+
+        # a batch replayed again after a crash before the commit is stored once
+        LoggerModel.create_logs(written)
+        assert LoggerModel.objects.count() == 3
+
+        handler.emit(logging.makeLogRecord({'levelname': 'INFO', 'msg': 'direct', 'module': 'tests'}))
+        assert LoggerModel.objects.count() == 4
+    finally:
+        handler.close()
+
+    # the records of a closed spool are picked up by the next process
+    database_is_down = True
+    spool = LogSpool(str(tmp_path), replay_interval=3600, write_logs=write_logs)
+    spool.write([{'message': 'left behind'}])
+    spool.close()
+
+    spool = LogSpool(str(tmp_path), replay_interval=3600, write_logs=lambda logs: written.append(logs))
+    try:
+        assert spool.degraded
+        assert spool.replay() == 1
+        assert written[-1] == [{'message': 'left behind'}]
+    finally:
+        spool.close()
+
+
+def test_log_spool_degrades_on_slow_writes(tmp_path):
+    spool = LogSpool(
+        str(tmp_path), slow_threshold=0.01, replay_interval=3600, write_logs=lambda logs: time.sleep(0.02)
+    )
+
+    try:
+        spool.write([{'message': 'slow'}])
+        assert spool.degraded
+
+        # later writes go to the spool without waiting on the database
+        started_at = time.monotonic()
+        spool.write([{'message': 'spooled'}])
+        assert time.monotonic() - started_at < 0.01
+
+        spool._LogSpool__write_logs = lambda logs: None
+        assert spool.replay() == 1
+        assert not spool.degraded
+    finally:
+        spool.close()
+
+
+def test_log_spool_does_not_wait_on_a_stalled_database(tmp_path):
+    # accepts connections and never answers, like a stalled server
+    stalled_server = socket.create_server(('127.0.0.1', 0))
+    client = pymongo.MongoClient(*stalled_server.getsockname(), connect=False)
+    spool = LogSpool(
+        str(tmp_path), slow_threshold=0.2, replay_interval=3600,
+        write_logs=lambda logs: client.logs.logger_model.insert_many(logs)
+    )
+
+    try:
+        started_at = time.monotonic()
+        spool.write([{'message': 'stalled'}])
+        assert time.monotonic() - started_at < 1
+
+        assert spool.degraded and not spool._spool.is_empty()
+    finally:
+        spool.close()
+        client.close()
+        stalled_server.close()
+
+
+def test_log_spool_write_racing_the_end_of_replay_is_not_stranded(tmp_path):
+    written = []
+    spool = LogSpool(str(tmp_path), replay_interval=3600, write_logs=written.extend)
+    spool.degraded = True
+    spool.write([{'message': 'spooled'}])
+
+    # a write arrives right after the replay found the spool empty
+    is_empty = spool._spool.is_empty
+    racing_writer = threading.Thread(target=spool.write, args=([{'message': 'racing'}],))
+
+    def is_empty_then_write():
+        empty = is_empty()
+        racing_writer.start()
+        racing_writer.join(0.1)
+        return empty
+
+    try:
+        spool._spool.is_empty = is_empty_then_write
+        assert spool.replay() == 1
+        spool._spool.is_empty = is_empty
+        racing_writer.join()
+
+        # the write waited for the switch and went to the database instead of the spool
+        assert not spool.degraded and spool._spool.is_empty()
+        assert [log['message'] for log in written] == ['spooled', 'racing']
+    finally:
+        spool.close()
+
+
+def test_logs_stream_pushes_filtered_records(client):
+    response = client.get('/logs/stream?level=warning&endpoint=/posts/' + '0' * 24 + '&search=failed', buffered=False)
+    chunks = iter(response.response)
+
+    assert response.mimetype == 'text/event-stream'
+    assert next(chunks) == b'retry: 3000\n\n'
+
+    for level, endpoint, error in (
+        (logging.ERROR, '/posts/' + 'a' * 24, 'request failed'),
+        (logging.INFO, '/posts/' + 'a' * 24, 'request failed'),
+        (logging.ERROR, '/login', 'request failed'),
+        (logging.ERROR, '/posts/' + 'b' * 24, 'not found'),
+    ):
+        logger.log(level, LogMessage('error', {
+            'error': error, 'endpoint': endpoint, 'method': 'GET'
+        }))
+    logger.error(LogMessage('error', {
+        'error': 'failed again', 'endpoint': '/posts/' + 'c' * 24, 'method': 'PATCH'
+    }))
+
+    events = [next(chunks).decode(), next(chunks).decode()]
+    data = [json.loads(event.split('data: ', 1)[1]) for event in events]
+
+    assert [item['params']['endpoint'] for item in data] == ['/posts/' + 'a' * 24, '/posts/' + 'c' * 24]
+    assert data[0]['log_type'] == 'ERROR'
+    assert data[0]['message'] == 'Error "request failed" occurred in /posts/' + 'a' * 24 + ' with method: GET'
+    assert events[0].startswith('id: ')
+
+    response.close()
+    assert not LoggerFactory.get_broadcaster()._subscriptions
+
+    assert client.get('/logs/stream?level=loud').status_code == 400
+
+
+def test_log_broadcaster_drops_slow_subscribers():
+    broadcaster = LogBroadcaster(queue_size=2, max_subscribers=2)
+    slow = broadcaster.subscribe()
+    errors_only = broadcaster.subscribe(logging.ERROR)
+
+    with pytest.raises(TooManySubscribers):
+        broadcaster.subscribe()
+
+    for index in range(3):
+        broadcaster.handle(logging.makeLogRecord({
+            'levelno': logging.INFO, 'levelname': 'INFO', 'msg': f'info {index}'
+        }))
+
+    assert slow.dropped and not errors_only.dropped
+    assert broadcaster._subscriptions == (errors_only,)
+    assert [slow.get(0)['message'], slow.get(0)['message']] == ['info 0', 'info 1']
+    assert errors_only.get(0) is None
+
+    # the freed slot can be taken by a new client
+    broadcaster.subscribe()
+
+
+def test_logger_factory_reuses_registered_logger():
+    cached_logger = LoggerFactory.get_logger('logging/py.log', 'INFO')
+
+    assert cached_logger is logger
+    # file, stream, database and the /logs/stream broadcaster
+    assert LoggerFactory.get_stats()['logging/py.log']['handlers'] == 4
+    assert len(LoggerFactory.get_stats()['logging/py.log']['open_descriptors']) == 1
+
+    try:
+        reconfigured_logger = LoggerFactory.get_logger('logging/py.log', 'ERROR', '%(message)s')
+
+        assert reconfigured_logger is logger
+        assert logger.level == logging.ERROR
+        assert all(handler.formatter._fmt == '%(message)s' for handler in logger.handlers)
+        assert LoggerFactory.get_stats()['logging/py.log']['handlers'] == 4
+    finally:
+        LoggerFactory.get_logger('logging/py.log', 'INFO')
+
+    assert logger.level == logging.INFO
+
+
+def test_shared_broadcaster_is_timed_once_per_record(app_test, tmp_path, monkeypatch):
+    monkeypatch.setattr(LoggerFactory, '_REGISTRY', dict(LoggerFactory._REGISTRY))
+    other_logger = LoggerFactory.get_logger(str(tmp_path / 'other.log'), 'INFO')
+
+    def count_emits() -> float:
+        counts, _ = LOG_HANDLER_EMIT_DURATION.labels('LogBroadcaster').snapshot()
+        return sum(counts)
+
+    try:
+        emits = count_emits()
+        other_logger.info('timed once')
+        assert count_emits() == emits + 1
+    finally:
+        for handler in other_logger.handlers:
+            if handler is not LoggerFactory.get_broadcaster():
+                handler.close()
+        other_logger.handlers = []
+
+
+def test_rotating_file_handler_compresses_and_indexes_segments(tmp_path):
+    log_file = str(tmp_path / 'py.log')
+    handler = RotatingCompressedFileHandler(log_file, max_bytes=100, backup_count=2)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    for index in range(8):
+        record = make_record(f'record {index} ' + 'x' * 50)
+        record.created = 1700000000 + index
+        handler.emit(record)
+
+    handler.close()
+
+    segments = read_segment_index(log_file)
+    assert [segment['records'] for segment in segments] == [2, 2]
+    assert all(segment['compressed'] and segment['file'].endswith('.gz') for segment in segments)
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        ['py.log', 'py.log.index'] + [segment['file'] for segment in segments]
+    )
+
+    with gzip.open(tmp_path / segments[0]['file'], 'rt') as segment_file:
+        assert segment_file.read().startswith('record 2 ')
+
+    in_range = find_segments(
+        log_file,
+        datetime.datetime.fromtimestamp(1700000005),
+        datetime.datetime.fromtimestamp(1700000006)
+    )
+    assert in_range == [str(tmp_path / segments[1]['file'])]
+
+
+def test_rotating_file_handler_indexes_the_segment_left_by_a_restart(tmp_path):
+    log_file = str(tmp_path / 'py.log')
+
+    handler = RotatingCompressedFileHandler(log_file, compression=None)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    for index in range(2):
+        record = make_record(f'before restart {index}')
+        record.created = 1700000000 + index
+        handler.emit(record)
+    handler.close()
+
+    handler = RotatingCompressedFileHandler(log_file, compression=None)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    record = make_record('after restart')
+    record.created = 1700001000
+    handler.emit(record)
+    handler.doRollover()
+    handler.close()
+
+    (segment,) = read_segment_index(log_file)
+    assert segment['first'] is None and segment['records'] == 3
+
+    # the records logged before the restart are still found by time
+    in_range = find_segments(
+        log_file,
+        datetime.datetime.fromtimestamp(1700000000),
+        datetime.datetime.fromtimestamp(1700000001)
+    )
+    assert in_range == [str(tmp_path / segment['file'])]
+
+
+def test_buffered_file_handler_coalesces_writes(tmp_path):
+    log_file = tmp_path / 'py.log'
+    handler = BufferedRotatingFileHandler(str(log_file), buffer_size=1024, flush_interval=60, fsync_policy='interval')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    handler.handle(make_record('first'))
+    handler.handle(make_record('second'))
+    assert log_file.read_text() == ''
+
+    handler.handle(make_record('failure', logging.ERROR))
+    assert log_file.read_text() == 'first\nsecond\nfailure\n'
+
+    handler.handle(make_record('x' * 1024))
+    assert log_file.read_text().endswith('x' * 1024 + '\n')
+
+    handler.handle(make_record('last'))
+    handler.close()
+    assert log_file.read_text().endswith('last\n')
+
+
+def test_buffered_stream_handler_flushes_on_interval():
+    stream = io.StringIO()
+    handler = BufferedStreamHandler(stream, flush_interval=0.05)
+
+    handler.handle(make_record('queued'))
+    assert stream.getvalue() == ''
+
+    for _ in range(50):
+        if stream.getvalue():
+            break
+        time.sleep(0.01)
+
+    assert stream.getvalue() == 'queued\n'
+    handler.close()
+
+
+def test_logs_expire_after_their_level_retention(app_test):
+    date_and_time = datetime.datetime(2024, 1, 1, 12)
+
+    assert LoggerModel.get_expire_at('INFO', date_and_time) == datetime.datetime(2024, 1, 8, 12)
+    assert LoggerModel.get_expire_at('ERROR', date_and_time) == datetime.datetime(2024, 3, 31, 12)
+
+    LoggerModel.create_log(log_file='tests', info_type='ERROR', message='kept', date_and_time=datetime.datetime.now())
+    assert get_log(message='kept').expire_at > datetime.datetime.now() + datetime.timedelta(days=89)
+
+    ttl_indexes = [
+        index for index in LoggerModel._get_collection().index_information().values()
+        if index.get('expireAfterSeconds') == 0
+    ]
+    assert [index['key'] for index in ttl_indexes] == [[('expire_at', 1)]]
+
+
+def test_logs_are_dated_and_expire_in_utc(app_test, monkeypatch):
+    # a local time zone far from UTC, the TTL monitor compares expire_at with UTC
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    try:
+        record = make_record('dated')
+        record.created = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.UTC).timestamp()
+        assert DatabaseHandler.get_log_fields(record)['date_and_time'] == datetime.datetime(2024, 1, 1, 12)
+
+        utcnow = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        expire_at = LoggerModel.get_expire_at('INFO', None)
+        assert abs(expire_at - (utcnow + datetime.timedelta(days=7))) < datetime.timedelta(minutes=1)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_storage_modes_meta():
+    settings = {**Config.LOGGER_STORAGE_SETTINGS, 'max_size': 1024, 'max_documents': 10}
+
+    capped_meta = get_storage_meta({**settings, 'mode': 'capped'})
+    assert capped_meta['max_size'] == 1024 and capped_meta['max_documents'] == 10
+    assert not any(isinstance(index, dict) and 'expireAfterSeconds' in index for index in capped_meta['indexes'])
+
+    timeseries_meta = get_storage_meta({**settings, 'mode': 'timeseries'})
+    assert not any(isinstance(index, dict) for index in timeseries_meta['indexes'])
+
+    with pytest.raises(ValueError):
+        get_storage_meta({**settings, 'mode': 'sharded'})
+
+
+def test_logs_analytics_reads_rollups(client):
+    create_user(client)
+
+    response = login_dummy_user(client)
+    access_token = response.json['access_token']
+
+    post_id = create_post(client, access_token).json['post']['id']
+    client.get(f'/posts/{post_id}')
+    client.delete(f'/posts/{post_id}', headers={'Authorization': f'Bearer {access_token}'})
+    client.delete(f'/posts/{post_id}', headers={'Authorization': f'Bearer {access_token}'})
+
+    LogRollup.flush()
+    assert LogRollup.objects(granularity='hour').count() <= LogRollup.objects(granularity='minute').count()
+
+    response = client.get('/logs/analytics?granularity=hour&group_by=level')
+    assert response.status_code == 200
+    assert response.json['total'] == 6
+    assert response.json['results'] == [{'level': 'ERROR', 'count': 1}, {'level': 'INFO', 'count': 5}]
+
+    response = client.get('/logs/analytics?group_by=endpoint,method&level=INFO')
+    assert {'endpoint': '/posts/<id>', 'method': 'DELETE', 'count': 1} in response.json['results']
+    assert {'endpoint': '/posts/<id>', 'method': 'GET', 'count': 1} in response.json['results']
+
+    response = client.get(f'/logs/analytics?group_by=user&endpoint=/posts/{post_id}&level=ERROR')
+    assert response.json['results'] == [{'user': 'test@example.com', 'count': 1}]
+
+    assert client.get('/logs/analytics?group_by=message').status_code == 400
+    assert client.get('/logs/analytics?from=yesterday').status_code == 400
+
+
+def test_get_posts_pages_with_projection(client):
+    create_user(client)
+
+    response = login_dummy_user(client)
+    access_token = response.json['access_token']
+
+    allow_several_posts()
+    post_ids = [create_post(client, access_token).json['post']['id'] for _ in range(3)]
+
+    response = client.get('/posts?limit=2&fields=title,author')
+    assert response.status_code == 200
+    assert [post['id'] for post in response.json['posts']] == post_ids[:2]
+    assert set(response.json['posts'][0]) == {'id', 'title', 'author'}
+    assert response.json['next'] == post_ids[1]
+
+    response = client.get(f'/posts?limit=2&after={response.json["next"]}')
+    assert [post['id'] for post in response.json['posts']] == post_ids[2:]
+    assert response.json['posts'][0]['text'] == 'This is a test post.'
+    assert response.json['next'] is None
+
+    assert client.get('/posts?fields=password').status_code == 400
+    assert client.get('/posts?after=not-an-id').status_code == 400
+
+
+def test_get_posts_stream(client):
+    create_user(client)
+
+    response = login_dummy_user(client)
+    access_token = response.json['access_token']
+
+    allow_several_posts()
+    post_ids = [create_post(client, access_token).json['post']['id'] for _ in range(3)]
+
+    response = client.get(f'/posts?stream=true&fields=title&after={post_ids[0]}')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert json.loads(response.data) == {
+        'posts': [{'id': post_id, 'title': 'Test Post'} for post_id in post_ids[1:]],
+        'next': None
+    }
+
+
+def test_posts_author_is_not_dereferenced(client, monkeypatch):
+    create_user(client)
+
+    response = login_dummy_user(client)
+    access_token = response.json['access_token']
+
+    allow_several_posts()
+    post_ids = [create_post(client, access_token).json['post']['id'] for _ in range(3)]
+    user = User.get_user_by_email('test@example.com')
+
+    post = Posts.get_post_by_id(post_ids[0])
+    assert post.to_json()['author'] == str(user.id)
+    post.verify_users_access(user)
+    assert isinstance(post._data['author'], DBRef)
+
+    finds = []
+    find = type(Posts._get_collection()).find
+
+    def counting_find(collection, *args, **kwargs):
+        if collection.name == 'base_model':
+            finds.append(args)
+        return find(collection, *args, **kwargs)
+
+    monkeypatch.setattr(type(Posts._get_collection()), 'find', counting_find)
+
+    response = client.get('/posts?expand=author')
+    assert len(finds) == 2
+    assert [post['author'] for post in response.json['posts']] == [
+        {'id': str(user.id), 'email': 'test@example.com', 'first_name': 'Test', 'last_name': 'User'}
+    ] * 3
+
+    response = client.get('/posts?expand=author&stream=true')
+    assert json.loads(response.data)['posts'][2]['author']['email'] == 'test@example.com'
+
+    response = client.get(f'/posts/{post_ids[1]}?expand=author')
+    assert response.json['posts']['author']['id'] == str(user.id)
+
+
+def test_posts_conditional_get(client, monkeypatch):
+    create_user(client)
+    access_token = login_dummy_user(client).json['access_token']
+    post_id = create_post(client, access_token).json['post']['id']
+
+    response = client.get('/posts?limit=10')
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    finds = []
+    find = type(Posts._get_collection()).find
+
+    def counting_find(collection, *args, **kwargs):
+        finds.append(collection.name)
+        return find(collection, *args, **kwargs)
+
+    monkeypatch.setattr(type(Posts._get_collection()), 'find', counting_find)
+
+    response = client.get('/posts?limit=10', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert 'base_model' not in finds
+
+    assert client.get('/posts?limit=10', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get('/posts?limit=20', headers={'If-None-Match': etag}).status_code == 200
+
+    response = client.get(f'/posts/{post_id}')
+    post_etag = response.headers['ETag']
+    assert client.get(f'/posts/{post_id}', headers={'If-None-Match': post_etag}).status_code == 304
+
+    client.patch(f'/posts/{post_id}', json={'title': 'Updated Test Post'}, headers={
+        'Authorization': f'Bearer {access_token}'
+    })
+
+    response = client.get(f'/posts/{post_id}', headers={'If-None-Match': post_etag})
+    assert response.status_code == 200
+    assert response.json['posts']['title'] == 'Updated Test Post'
+    assert response.headers['ETag'] != post_etag
+    assert client.get(f'/posts/{post_id}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    response = client.get('/posts?limit=10', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    response = client.patch(f'/posts/{post_id}', json={'version': 10}, headers={
+        'Authorization': f'Bearer {access_token}'
+    })
+    assert response.status_code == 400
+
+
+def test_posts_stored_before_versioning_change_etag_on_first_update(client):
+    create_user(client)
+    access_token = login_dummy_user(client).json['access_token']
+    post_id = create_post(client, access_token).json['post']['id']
+
+    Posts._get_collection().update_one({'_id': ObjectId(post_id)}, {'$unset': {'version': '', 'updated_at': ''}})
+
+    post_etag = client.get(f'/posts/{post_id}').headers['ETag']
+
+    client.patch(f'/posts/{post_id}', json={'title': 'Updated Test Post'}, headers={
+        'Authorization': f'Bearer {access_token}'
+    })
+
+    response = client.get(f'/posts/{post_id}', headers={'If-None-Match': post_etag})
+    assert response.status_code == 200
+    assert response.json['posts']['title'] == 'Updated Test Post'
+
+
+def test_expanded_posts_etags_change_with_their_author(client):
+    create_user(client)
+    access_token = login_dummy_user(client).json['access_token']
+    post_id = create_post(client, access_token).json['post']['id']
+
+    listing_etag = client.get('/posts?expand=author').headers['ETag']
+    post_etag = client.get(f'/posts/{post_id}?expand=author').headers['ETag']
+
+    user = User.get_user_by_email('test@example.com')
+    user.first_name = 'Renamed'
+    user.save()
+
+    response = client.get(f'/posts/{post_id}?expand=author', headers={'If-None-Match': post_etag})
+    assert response.status_code == 200
+    assert response.json['posts']['author']['first_name'] == 'Renamed'
+
+    response = client.get('/posts?expand=author', headers={'If-None-Match': listing_etag})
+    assert response.status_code == 200
+    listing_etag = response.headers['ETag']
+
+    # deleting the user deletes their posts
+    user.delete()
+    response = client.get('/posts?expand=author', headers={'If-None-Match': listing_etag})
+    assert response.status_code == 200
+    assert response.json['posts'] == []
+
+
+def test_authenticated_user_is_cached(client, monkeypatch):
+    create_user(client)
+    access_token = login_dummy_user(client).json['access_token']
+    user = User.get_user_by_email('test@example.com')
+
+    lookups = []
+    get_user_by_id = User.get_user_by_id
+
+    def counting_get_user_by_id(user_id):
+        lookups.append(user_id)
+        return get_user_by_id(user_id)
+
+    monkeypatch.setattr(User, 'get_user_by_id', counting_get_user_by_id)
+    user_cache.clear()
+
+    for _ in range(3):
+        with app.test_request_context(headers={'Authorization': f'Bearer {access_token}'}):
+            verify_jwt_in_request()
+            assert get_user_instance_by_jwt_token() == get_user_instance_by_jwt_token() == user
+
+    assert lookups == [str(user.id)]
+
+    # the cache holds immutable claims, a request builds its own User from them
+    assert user_cache.get(str(user.id)) == (('email', user.email), ('first_name', 'Test'), ('last_name', 'User'))
+    g.pop('current_user')
+    with app.test_request_context(headers={'Authorization': f'Bearer {access_token}'}):
+        verify_jwt_in_request()
+        cached_user = get_user_instance_by_jwt_token()
+        assert cached_user == user and cached_user is not user and cached_user.first_name == 'Test'
+
+    assert lookups == [str(user.id)]
+
+    user.first_name = 'Renamed'
+    user.save()
+
+    with app.test_request_context(headers={'Authorization': f'Bearer {access_token}'}):
+        verify_jwt_in_request()
+        assert get_user_instance_by_jwt_token().first_name == 'Renamed'
+
+    assert len(lookups) == 2
+
+
+def test_identity_claims_skip_user_lookup(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'USER_CACHE_SETTINGS', {
+        **app.config['USER_CACHE_SETTINGS'], 'enabled': False, 'jwt_identity_claims': True
+    })
+    g.pop('current_user', None)
+
+    create_user(client)
+    access_token = login_dummy_user(client).json['access_token']
+
+    def failing_get_user_by_id(user_id):
+        raise AssertionError('The user should come from the token')
+
+    monkeypatch.setattr(User, 'get_user_by_id', failing_get_user_by_id)
+
+    response = create_post(client, access_token)
+    assert response.status_code == 200
+
+    log = get_log(template='user_created_the_table_record')
+    assert log.params['email'] == 'test@example.com'
+    assert log.params['user_id'] == response.json['post']['author']
+
+
+def test_login_rehashes_password_with_configured_rounds(client, monkeypatch):
+    create_user(client)
+    assert PasswordHasher.get_rounds(User.get_user_by_email('test@example.com').password) == 4
+
+    settings = {**app.config['PASSWORD_HASHING_SETTINGS'], 'rounds': 5}
+    monkeypatch.setitem(app.config, 'PASSWORD_HASHING_SETTINGS', settings)
+
+    assert login_dummy_user(client).status_code == 200
+    assert PasswordHasher.get_rounds(User.get_user_by_email('test@example.com').password) == 5
+    assert login_dummy_user(client).status_code == 200
+
+
+def test_password_hashing_sheds_load(client, monkeypatch):
+    create_user(client)
+
+    monkeypatch.setitem(app.config, 'PASSWORD_HASHING_SETTINGS', {
+        **app.config['PASSWORD_HASHING_SETTINGS'], 'workers': 1, 'max_pending': 0
+    })
+
+    response = login_dummy_user(client)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_password_hasher_process_pool():
+    hasher = PasswordHasher({'rounds': 4, 'workers': 1, 'max_pending': 2, 'timeout': 30})
+
+    try:
+        hashed_password = hasher.hash('password123')
+
+        assert hasher.verify('password123', hashed_password)
+        assert not hasher.verify('password321', hashed_password)
+        assert not hasher.needs_rehash(hashed_password)
+    finally:
+        hasher.shutdown()
+
+
+def test_password_hasher_timed_out_operations_keep_their_slot():
+    settings = {'rounds': 4, 'workers': 1, 'max_pending': 1, 'timeout': 30}
+    hasher = PasswordHasher(settings)
+
+    try:
+        # start the worker, so the next operation runs at once and can't be cancelled
+        hashed_password = hasher.hash('password123')
+
+        settings.update(rounds=14, timeout=0.01)
+        with pytest.raises(PasswordHashingOverloaded, match='timed out'):
+            hasher.hash('password123')
+
+        # the timed out hash still runs in the worker and holds the only slot
+        started_at = time.monotonic()
+        with pytest.raises(PasswordHashingOverloaded, match='Too many'):
+            hasher.verify('password123', hashed_password)
+        assert time.monotonic() - started_at < 0.01
+
+        deadline = time.monotonic() + 30
+        while hasher._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        settings.update(rounds=4, timeout=30)
+        assert hasher.verify('password123', hashed_password)
+    finally:
+        hasher.shutdown()
+
+
+def test_endpoints_benchmark_runs():
+    results = endpoints.run(2)
+
+    assert len(results) == 10 and all(result['operations'] == 2 for result in results)
+
+
+def test_benchmark_comparison_flags_regressions():
+    baseline = [
+        {'name': 'handler.file', 'ops_per_second': 1000, 'p50_us': 10},
+        {'name': 'handler.stream', 'ops_per_second': 1000, 'p50_us': 10},
+        {'name': 'handler.removed', 'ops_per_second': 1000, 'p50_us': 10},
+    ]
+    results = [
+        {'name': 'handler.file', 'ops_per_second': 950, 'p50_us': 10.5},
+        {'name': 'handler.stream', 'ops_per_second': 700, 'p50_us': 14},
+        {'name': 'handler.new', 'ops_per_second': 1000, 'p50_us': 10},
+    ]
+
+    comparison = compare_results(baseline, results, threshold=0.1)
+
+    assert [(row['name'], row['regressed']) for row in comparison] == [
+        ('handler.file', False), ('handler.stream', True)
+    ]
+    assert comparison[1]['throughput_change'] == pytest.approx(-0.3)
+
+
+def test_sharded_metrics_sum_across_threads():
+    counter = Counter('test_total', 'Test counter', ('kind',))
+    histogram = Histogram('test_seconds', 'Test histogram', buckets=(0.1, 1))
+
+    def work():
+        for _ in range(1000):
+            counter.labels('a').inc()
+            histogram.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # shards of finished threads are folded into the retired totals
+    assert counter.labels('a').value == 8000
+    assert histogram.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 0.0',
+        'test_seconds_bucket{le="1"} 8000.0',
+        'test_seconds_bucket{le="+Inf"} 8000.0',
+        'test_seconds_sum 4000.0',
+        'test_seconds_count 8000.0',
+    ]
+
+
+def test_metrics_endpoint(client):
+    create_user(client)
+    access_token = login_dummy_user(client).json['access_token']
+    create_post(client, access_token)
+
+    metrics = client.get('/metrics').data.decode()
+
+    assert 'http_request_duration_seconds_count{endpoint="/posts",method="POST",status="200"}' in metrics
+    assert 'http_request_duration_seconds_count{endpoint="/register",method="POST",status="201"}' in metrics
+    assert 'http_request_mongodb_commands_count{endpoint="/posts",method="POST"}' in metrics
+    assert 'log_handler_emit_duration_seconds_count{handler="DatabaseHandler"}' in metrics
+    assert 'password_hashing_duration_seconds_count{operation="verify"}' in metrics
+
+
+def test_streamed_requests_are_measured_until_the_response_closes(client, monkeypatch):
+    class Event:
+        command_name = 'find'
+        duration_micros = 1000
+
+    def iterate_posts(*args, **kwargs):
+        # the body is generated after the view returned, with the MongoDB commands it runs
+        time.sleep(0.05)
+        MongoCommandListener().succeeded(Event())
+        yield {'id': 'post'}
+
+    monkeypatch.setattr(Posts, 'iterate_posts', iterate_posts)
+
+    durations = HTTP_REQUEST_DURATION.labels('/posts', 'GET', 200)
+    commands = HTTP_REQUEST_MONGODB_COMMANDS.labels('/posts', 'GET')
+    count, duration = sum(durations.snapshot()[0]), durations.snapshot()[1]
+    command_total = commands.snapshot()[1]
+
+    response = client.get('/posts?stream=true')
+    assert response.json == {'posts': [{'id': 'post'}], 'next': None}
+    response.close()
+
+    assert sum(durations.snapshot()[0]) == count + 1
+    assert durations.snapshot()[1] - duration >= 0.05
+    assert commands.snapshot()[1] - command_total == 1
+
+
+def test_mongo_command_listener_attributes_commands_to_the_request():
+    class Event:
+        command_name = 'find'
+        duration_micros = 1500
+
+    listener = MongoCommandListener()
+    succeeded = MONGODB_COMMANDS.labels('find', 'succeeded').value
+
+    request_stats.start()
+    listener.succeeded(Event())
+    listener.failed(Event())
+
+    assert request_stats.mongodb_commands == 2
+    assert request_stats.mongodb_duration == pytest.approx(0.003)
+    assert MONGODB_COMMANDS.labels('find', 'succeeded').value == succeeded + 1
+
+    request_stats.finish('/test', 'GET', 200)
+    listener.succeeded(Event())
+    assert request_stats.mongodb_commands == 2
+
+
+def test_mongo_pool_listener_times_checkouts():
+    class Event:
+        duration = 0.2
+        reason = 'timeout'
+
+    listener = MongoPoolListener('tests')
+    listener.connection_checked_out(Event())
+    listener.connection_check_out_failed(Event())
+
+    counts, total = MONGODB_POOL_WAIT_DURATION.labels('tests').snapshot()
+    assert sum(counts) == 2 and total == pytest.approx(0.4)
+    assert MONGODB_POOL_CHECKOUTS.labels('tests', 'succeeded').value == 1
+    assert MONGODB_POOL_CHECKOUTS.labels('tests', 'timeout').value == 1
+
+
+def test_logs_are_written_through_their_own_connection(app_test, monkeypatch):
+    write_concerns = []
+    with_options = mongomock.collection.Collection.with_options
+
+    def record_write_concern(collection, *args, **kwargs):
+        write_concerns.append((collection.name, kwargs['write_concern'].document))
+        return with_options(collection, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'with_options', record_write_concern)
+    monkeypatch.setitem(Config.LOGGER_CONNECTION_SETTINGS, 'write_concerns', {'INFO': 0, 'ERROR': 'majority'})
+
+    LoggerModel.create_logs([
+        {'info_type': 'INFO', 'message': 'info'},
+        {'info_type': 'ERROR', 'message': 'error'},
+        {'info_type': 'INFO', 'message': 'another info'},
+    ])
+
+    # the rollups are written by their own flusher thread
+    log_write_concerns = sorted((entry for entry in write_concerns if entry[0] == 'logger_model'), key=str)
+    assert log_write_concerns == [('logger_model', {'w': 'majority'}), ('logger_model', {'w': 0})]
+    assert LoggerModel.objects.count() == 3
+
+    alias = Config.LOGGER_CONNECTION_SETTINGS['alias']
+    assert LoggerModel._get_db() is get_db(alias) and LogRollup._get_db() is get_db(alias)
+    assert Posts._get_db() is get_db('default')
+
+
+def test_log_rollups_are_written_in_the_background(app_test, monkeypatch):
+    writes = []
+    with_options = mongomock.collection.Collection.with_options
+
+    def record_write_concern(collection, *args, **kwargs):
+        writes.append((collection.name, kwargs['write_concern'].document))
+        return with_options(collection, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, 'with_options', record_write_concern)
+    monkeypatch.setitem(Config.LOGGER_CONNECTION_SETTINGS, 'write_concerns', {'INFO': 0, 'ERROR': 'majority'})
+
+    # holds off the flusher thread
+    with LogRollup._flush_lock:
+        for _ in range(2):
+            LoggerModel.create_logs([
+                {'info_type': 'INFO', 'message': 'info', 'params': {'endpoint': '/posts'}},
+                {'info_type': 'ERROR', 'message': 'error', 'params': {'endpoint': '/posts'}},
+            ])
+
+        # writing a log makes no rollup round trip, the increments are summed in memory
+        assert [write for write in writes if write[0] == 'log_rollup'] == []
+        assert sorted(LogRollup._pending.values()) == [2, 2, 2, 2]
+
+    LogRollup.flush()
+
+    rollup_writes = [write for write in writes if write[0] == 'log_rollup']
+    assert sorted(rollup_writes, key=str) == [('log_rollup', {'w': 'majority'}), ('log_rollup', {'w': 0})]
+
+    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    counts = LogRollup.get_counts('hour', now - datetime.timedelta(hours=1), now, ('level',))
+    assert counts == [{'level': 'ERROR', 'count': 2}, {'level': 'INFO', 'count': 2}]
+
+
+def test_logs_export_streams_a_time_range(client, monkeypatch, tmp_path):
+    # recent, the expired logs are deleted by the TTL index
+    start = datetime.datetime.now().replace(second=0, microsecond=0) - datetime.timedelta(hours=1)
+
+    def get_time(minute: int) -> str:
+        return (start + datetime.timedelta(minutes=minute)).isoformat()
+
+    LoggerModel.create_logs([
+        {
+            'log_file': 'logging/py.log',
+            'info_type': 'ERROR' if minute % 2 else 'INFO',
+            'message': f'log {minute}',
+            'date_and_time': start + datetime.timedelta(minutes=minute),
+            'template': 'endpoint_was_called',
+            'params': {'endpoint': f'/posts/{minute}', 'method': 'GET'}
+        }
+        for minute in range(10)
+    ])
+
+    # documents are never built, the raw cursor is encoded directly
+    monkeypatch.setattr(LoggerModel, '_from_son', None)
+
+    response = client.get(f'/logs/export?from={get_time(2)}&to={get_time(8)}&level=error')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/gzip'
+    assert f'logs-{start + datetime.timedelta(minutes=2):%Y%m%dT%H%M%S}-' in response.headers['Content-Disposition']
+    assert response.headers['Content-Disposition'].endswith('.ndjson.gz')
+
+    logs = [json.loads(line) for line in gzip.decompress(response.data).decode().splitlines()]
+    assert [log['message'] for log in logs] == ['log 3', 'log 5', 'log 7']
+    assert logs[0]['data_and_time'] == get_time(3)
+    assert logs[0]['params'] == {'endpoint': '/posts/3', 'method': 'GET'}
+
+    response = client.get(f'/logs/export?from={get_time(0)}&to={get_time(2)}&format=csv&gzip=false')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert [row['message'] for row in rows] == ['log 0', 'log 1']
+    assert json.loads(rows[1]['params']) == {'endpoint': '/posts/1', 'method': 'GET'}
+
+    assert client.get('/logs/export?from=2024-05-01').status_code == 400
+    assert client.get('/logs/export?from=2024-05-01&to=2024-05-02&level=LOUD').status_code == 400
+    assert client.get('/logs/export?from=2024-05-01&to=2024-05-02&format=xml').status_code == 400
+
+    output = tmp_path / 'logs.csv.gz'
+    assert export_main(['--from', get_time(0), '--to', get_time(60), '--format', 'csv', '--output', str(output)]) == 0
+    assert len(gzip.decompress(output.read_bytes()).decode().splitlines()) == 11